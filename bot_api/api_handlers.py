@@ -1,7 +1,9 @@
 import logging
+import os
 from flask import Flask, jsonify, request
 from wallet.wallet_manager import WalletManager
 from database.db_service import UserService, RaffleService
+from wallet.wallet_pool import wallet_pool
 from transaction.raffle_processor import RaffleProcessor
 from config.settings import config
 
@@ -12,6 +14,13 @@ wallet_manager = WalletManager()
 raffle_processor = RaffleProcessor()
 
 
+def start_background_services():
+    """Фоновые службы API: подпись, receipt, копия лотереи, балансы, пул кошельков"""
+    raffle_processor.start()
+    if config.WALLET_POOL_ENABLED and config.WALLET_MODE != 'hd':
+        wallet_pool.start(wallet_manager)
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -51,15 +60,8 @@ def generate_wallet():
                 'message': 'User already has a wallet'
             }), 200
         
-        # Генерируем новый кошелек
-        wallet = wallet_manager.generate_wallet()
-        
-        # Создаем пользователя в БД
-        user = UserService.create_user(
-            tg_id=tg_id,
-            evm_address=wallet['address'],
-            encrypted_key=wallet['encrypted_private_key']
-        )
+        # Генерируем новый кошелек и создаем пользователя в БД
+        wallet = wallet_manager.create_user_wallet(tg_id)
         
         return jsonify({
             'success': True,
@@ -103,6 +105,64 @@ def get_balance(tg_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/wallet/balances', methods=['POST'])
+def get_balances():
+    """
+    Получить балансы USDT нескольких пользователей (на одном блоке)
+    
+    Request body:
+    {
+        "tg_ids": ["123456789", "987654321"]
+    }
+    
+    Response:
+    {
+        "success": true,
+        "block_number": 123456,
+        "balances": {
+            "123456789": {"address": "0x...", "balance": 1000000, "balance_usdt": 1.0}
+        },
+        "not_found": ["987654321"]
+    }
+    """
+    try:
+        data = request.json or {}
+        tg_ids = data.get('tg_ids')
+        
+        if not isinstance(tg_ids, list) or not tg_ids:
+            return jsonify({'success': False, 'error': 'Missing tg_ids'}), 400
+        if len(tg_ids) > config.MAX_BALANCE_BATCH:
+            return jsonify({
+                'success': False,
+                'error': f'Too many tg_ids (max {config.MAX_BALANCE_BATCH})'
+            }), 400
+        
+        tg_ids = [str(tg_id) for tg_id in tg_ids]
+        users = UserService.get_users_by_tg_ids(tg_ids)
+        result = raffle_processor.check_user_balances(
+            {tg_id: user.evm_address for tg_id, user in users.items()}
+        ) if users else {'block_number': None, 'balances': {}}
+        
+        balances = {}
+        for tg_id, balance in result['balances'].items():
+            balances[tg_id] = {
+                'address': users[tg_id].evm_address,
+                'balance': balance,
+                'balance_usdt': balance / 1e18 if balance is not None else None  # Предполагая 18 decimals
+            }
+        
+        return jsonify({
+            'success': True,
+            'block_number': result['block_number'],
+            'balances': balances,
+            'not_found': [tg_id for tg_id in tg_ids if tg_id not in users]
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"Error getting balances: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/raffle/status', methods=['GET'])
 def get_raffle_status():
     """
@@ -114,7 +174,18 @@ def get_raffle_status():
         "players_count": 5,
         "state": "OPEN",
         "entrance_fee": 1000000,
-        "pool": 5000000
+        "pool": 5000000,
+        "raffle_id": 3,
+        "deposit_amount": 1000000,
+        "participants_count": 5,
+        "prize_pool": 5000000,
+        "start_time": 1700000000,
+        "end_time": 1700086400,
+        "time_remaining": 3600,
+        "total_deposits": 5000000,
+        "winner": "0x0000000000000000000000000000000000000000",
+        "claimed": false,
+        "block_number": 123456
     }
     """
     try:
@@ -136,7 +207,8 @@ def enter_raffle():
     
     Request body:
     {
-        "tg_id": "123456789"
+        "tg_id": "123456789",
+        "async": false (true - вернуть job_id сразу после отправки транзакций)
     }
     
     Response:
@@ -145,6 +217,14 @@ def enter_raffle():
         "tx_hash": "0x...",
         "message": "Entry processed"
     }
+    
+    Response (async, 202):
+    {
+        "success": true,
+        "job_id": "...",
+        "tx_hash": "0x...",
+        "status": "PENDING"
+    }
     """
     try:
         data = request.json
@@ -157,10 +237,32 @@ def enter_raffle():
         if not user:
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
+        if data.get('async', config.ASYNC_ENTRY_SUBMISSION):
+            result = raffle_processor.submit_user_entry(
+                tg_id=tg_id,
+                evm_address=user.evm_address,
+                encrypted_key=user.encrypted_private_key,
+                hd_index=user.hd_index
+            )
+            
+            if not result['success']:
+                return jsonify({
+                    'success': False,
+                    'error': result['error']
+                }), 400
+            
+            return jsonify({
+                'success': True,
+                'job_id': result['job_id'],
+                'tx_hash': result['tx_hash'],
+                'status': 'PENDING'
+            }), 202
+        
         result = raffle_processor.process_user_entry(
             tg_id=tg_id,
             evm_address=user.evm_address,
-            encrypted_key=user.encrypted_private_key
+            encrypted_key=user.encrypted_private_key,
+            hd_index=user.hd_index
         )
         
         if not result['success']:
@@ -180,6 +282,89 @@ def enter_raffle():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/raffle/enter/<job_id>', methods=['GET'])
+def get_entry_status(job_id):
+    """
+    Статус асинхронного входа в лотерею
+    
+    Response:
+    {
+        "success": true,
+        "job_id": "...",
+        "tg_id": "123456789",
+        "status": "PENDING" | "MINED" | "FAILED",
+        "tx_hash": "0x...",
+        "block_number": 123,
+        "error": null
+    }
+    """
+    try:
+        job = raffle_processor.get_entry_status(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            **job
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"Error getting entry status: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/raffle/enter/bulk', methods=['POST'])
+def enter_raffle_bulk():
+    """
+    Массовый вход в лотерею (ТОЛЬКО ДЛЯ АДМИНА)
+    
+    Request body:
+    {
+        "tg_ids": ["123456789", "987654321"]
+    }
+    
+    Response (202):
+    {
+        "success": true,
+        "submitted": 1,
+        "results": [
+            {"tg_id": "123456789", "success": true, "job_id": "...", "tx_hash": "0x...", "error": null},
+            {"tg_id": "987654321", "success": false, "job_id": null, "tx_hash": null, "error": "User not found"}
+        ]
+    }
+    """
+    try:
+        auth_token = request.headers.get('Authorization')
+        if not auth_token or auth_token != f"Bearer {config.SECRET_KEY}":
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        
+        data = request.json or {}
+        tg_ids = data.get('tg_ids')
+        
+        if not isinstance(tg_ids, list) or not tg_ids:
+            return jsonify({'success': False, 'error': 'Missing tg_ids'}), 400
+        if len(tg_ids) > config.BULK_ENTRY_MAX_USERS:
+            return jsonify({
+                'success': False,
+                'error': f'Too many tg_ids (max {config.BULK_ENTRY_MAX_USERS})'
+            }), 400
+        
+        try:
+            results = raffle_processor.submit_bulk_entries(tg_ids)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'submitted': sum(1 for result in results if result['success']),
+            'results': results
+        }), 202
+    
+    except Exception as e:
+        logger.error(f"Error in bulk entry: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/raffle/draw', methods=['POST'])
 def trigger_draw():
     """
@@ -248,4 +433,7 @@ def get_user_stats(tg_id):
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
+    # С debug=True сервер работает в дочернем процессе перезагрузчика
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     app.run(host=config.API_HOST, port=config.API_PORT, debug=True)
@@ -5,22 +5,129 @@ load_dotenv()
 
 class Config:
     RPC_URL = os.getenv('RPC_URL')
+    RPC_CONNECTION_LIMIT = int(os.getenv('RPC_CONNECTION_LIMIT', 20))
+    RPC_BATCH_SIZE = int(os.getenv('RPC_BATCH_SIZE', 100))
+    # Сколько tg_id можно передать в POST /api/wallet/balances
+    MAX_BALANCE_BATCH = int(os.getenv('MAX_BALANCE_BATCH', 1000))
+    
+    # Фоновое отслеживание receipt отправленных транзакций
+    RECEIPT_POLL_INTERVAL = float(os.getenv('RECEIPT_POLL_INTERVAL', 2))
+    RECEIPT_TIMEOUT = float(os.getenv('RECEIPT_TIMEOUT', 120))
+    # Через сколько секунд без receipt транзакция считается выброшенной из mempool (FAILED)
+    RECEIPT_MAX_AGE = float(os.getenv('RECEIPT_MAX_AGE', RECEIPT_TIMEOUT * 15))
     CHAIN_ID = int(os.getenv('CHAIN_ID', 11155111))
     
+    # Оракул комиссий: EIP-1559 по eth_feeHistory, одно обновление на блок
+    USE_EIP1559 = os.getenv('USE_EIP1559', 'true').lower() == 'true'
+    FEE_CACHE_TTL = float(os.getenv('FEE_CACHE_TTL', 12))
+    # Через сколько секунд снова пробовать eth_feeHistory, если нода его не поддерживала
+    FEE_EIP1559_REPROBE_SECONDS = float(os.getenv('FEE_EIP1559_REPROBE_SECONDS', 600))
+    FEE_HISTORY_BLOCKS = int(os.getenv('FEE_HISTORY_BLOCKS', 10))
+    FEE_PRIORITY_PERCENTILE = int(os.getenv('FEE_PRIORITY_PERCENTILE', 50))
+    MIN_PRIORITY_FEE = int(os.getenv('MIN_PRIORITY_FEE', 100_000_000))
+    
+    # Кеш лимитов газа по фактическому gasUsed (контракт + селектор + форма calldata)
+    GAS_PROFILE_MIN_SAMPLES = int(os.getenv('GAS_PROFILE_MIN_SAMPLES', 5))
+    GAS_PROFILE_WINDOW = int(os.getenv('GAS_PROFILE_WINDOW', 50))
+    # Если разброс gasUsed (std / mean) больше, снова используется estimate_gas
+    GAS_PROFILE_MAX_VARIATION = float(os.getenv('GAS_PROFILE_MAX_VARIATION', 0.05))
+    GAS_PROFILE_MARGIN = float(os.getenv('GAS_PROFILE_MARGIN', 1.1))
+    
     RAFFLE_CONTRACT_ADDRESS = os.getenv('RAFFLE_CONTRACT_ADDRESS')
+    # Multicall3 для чтения состояния лотереи одним eth_call (пусто - JSON-RPC batch)
+    MULTICALL3_ADDRESS = os.getenv('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11')
+    # Как часто копия состояния лотереи в API забирает новые события
+    MIRROR_POLL_INTERVAL = float(os.getenv('MIRROR_POLL_INTERVAL', 2))
     USDT_CONTRACT_ADDRESS = os.getenv('USDT_CONTRACT_ADDRESS')
     
     VRF_COORDINATOR_ADDRESS = os.getenv('VRF_COORDINATOR_ADDRESS')
     SUBSCRIPTION_ID = os.getenv('SUBSCRIPTION_ID')
     
+    # Асинхронный вход в лотерею: вернуть job_id сразу после отправки транзакций
+    ASYNC_ENTRY_SUBMISSION = os.getenv('ASYNC_ENTRY_SUBMISSION', 'false').lower() == 'true'
+    DEPOSIT_GAS_LIMIT = int(os.getenv('DEPOSIT_GAS_LIMIT', 200000))
+    # Массовый вход (POST /api/raffle/enter/bulk)
+    BULK_ENTRY_WORKERS = int(os.getenv('BULK_ENTRY_WORKERS', 8))
+    BULK_ENTRY_MAX_USERS = int(os.getenv('BULK_ENTRY_MAX_USERS', 1000))
+    
     ADMIN_PRIVATE_KEY = os.getenv('ADMIN_PRIVATE_KEY')
     ADMIN_PUBLIC_ADDRESS = os.getenv('ADMIN_PUBLIC_ADDRESS')
     
+    # Инкрементальное сканирование логов
+    START_BLOCK = int(os.getenv('START_BLOCK')) if os.getenv('START_BLOCK') else None
+    INITIAL_LOOKBACK_BLOCKS = int(os.getenv('INITIAL_LOOKBACK_BLOCKS', 100))
+    CONFIRMATION_BLOCKS = int(os.getenv('CONFIRMATION_BLOCKS', 0))
+    # Записи из событий остаются PENDING, пока блок не окажется на этой глубине
+    CONFIRMATION_DEPTH = int(os.getenv('CONFIRMATION_DEPTH', 12))
+    # Сколько последних хешей блоков хранить для поиска общего предка при реорганизации
+    REORG_HISTORY_BLOCKS = int(os.getenv('REORG_HISTORY_BLOCKS', 256))
+    MAX_BLOCK_RANGE = int(os.getenv('MAX_BLOCK_RANGE', 2000))
+    
+    # 'topic' - фильтр Transfer по индексированному `to` на стороне ноды, 'scan' - все Transfer
+    DEPOSIT_DETECTION_MODE = os.getenv('DEPOSIT_DETECTION_MODE', 'topic')
+    TOPIC_FILTER_CHUNK_SIZE = int(os.getenv('TOPIC_FILTER_CHUNK_SIZE', 500))
+    # Историческое переиндексирование (python main.py backfill)
+    RAFFLE_DEPLOY_BLOCK = int(os.getenv('RAFFLE_DEPLOY_BLOCK')) if os.getenv('RAFFLE_DEPLOY_BLOCK') else None
+    BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', 4))
+    BACKFILL_INITIAL_RANGE = int(os.getenv('BACKFILL_INITIAL_RANGE', 2000))
+    BACKFILL_MIN_RANGE = int(os.getenv('BACKFILL_MIN_RANGE', 10))
+    BACKFILL_MAX_RANGE = int(os.getenv('BACKFILL_MAX_RANGE', 100000))
+    BACKFILL_TARGET_LOGS = int(os.getenv('BACKFILL_TARGET_LOGS', 2000))
+    
+    # Окно перекрытия инкрементальной загрузки адресов (по users.created_at)
+    ADDRESS_INDEX_OVERLAP_SECONDS = float(os.getenv('ADDRESS_INDEX_OVERLAP_SECONDS', 300))
+    
+    # Балансы USDT пользователей в памяти API (обновляются по Transfer)
+    BALANCE_LEDGER_ENABLED = os.getenv('BALANCE_LEDGER_ENABLED', 'true').lower() == 'true'
+    BALANCE_POLL_INTERVAL = float(os.getenv('BALANCE_POLL_INTERVAL', 2))
+    BALANCE_RECONCILE_SECONDS = float(os.getenv('BALANCE_RECONCILE_SECONDS', 300))
+    
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///raffle.db')
+    # PostgreSQL: пул соединений
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    # SQLite: WAL, synchronous=NORMAL, memory-mapped I/O
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    # Async-драйвер для слушателей (по умолчанию из DATABASE_URL: aiosqlite / asyncpg)
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
     
     ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', 'default_32_char_key_for_dev!!!')
+    # Прежние ключи шифрования (через запятую): ими только расшифровываем, пока идет ротация
+    ENCRYPTION_KEYS_OLD = [key for key in os.getenv('ENCRYPTION_KEYS_OLD', '').split(',') if key]
+    KEY_ROTATION_CHUNK_SIZE = int(os.getenv('KEY_ROTATION_CHUNK_SIZE', 1000))
+    KEY_ROTATION_WORKERS = int(os.getenv('KEY_ROTATION_WORKERS', os.cpu_count() or 1))
+    
+    # Расшифровка ключей и подпись транзакций пользователей в пуле процессов (0 - в потоке запроса)
+    SIGNING_WORKERS = int(os.getenv('SIGNING_WORKERS', os.cpu_count() or 1))
+    SIGNING_START_METHOD = os.getenv('SIGNING_START_METHOD', 'fork')
+    SIGNING_TIMEOUT = float(os.getenv('SIGNING_TIMEOUT', 30))
+    
+    # 'random' - отдельный случайный ключ на пользователя, 'hd' - ключи из одного мастер-сида
+    WALLET_MODE = os.getenv('WALLET_MODE', 'random')
+    HD_MASTER_SEED = os.getenv('HD_MASTER_SEED')  # мнемоника, зашифрованная ENCRYPTION_KEY
+    HD_PASSPHRASE = os.getenv('HD_PASSPHRASE', '')
+    # Последний уровень hardened: утекший ключ пользователя вместе с xpub не раскрывает соседние
+    HD_DERIVATION_PATH = os.getenv('HD_DERIVATION_PATH', "m/44'/60'/0'/0/{index}'")
+    HD_KEY_CACHE_SIZE = int(os.getenv('HD_KEY_CACHE_SIZE', 10000))
+    HD_KEY_CACHE_TTL = float(os.getenv('HD_KEY_CACHE_TTL', 600))
+    
+    # Пул заранее созданных зашифрованных кошельков для /api/wallet/generate
+    WALLET_POOL_ENABLED = os.getenv('WALLET_POOL_ENABLED', 'true').lower() == 'true'
+    WALLET_POOL_SIZE = int(os.getenv('WALLET_POOL_SIZE', 500))
+    WALLET_POOL_LOW_WATERMARK = int(os.getenv('WALLET_POOL_LOW_WATERMARK', 100))
+    WALLET_POOL_REFILL_BATCH = int(os.getenv('WALLET_POOL_REFILL_BATCH', 50))
+    WALLET_POOL_CHECK_SECONDS = float(os.getenv('WALLET_POOL_CHECK_SECONDS', 30))
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
     
+    # Уведомления бота (шина событий слушателей)
+    BOT_WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL')
+    BOT_WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET')
+    EVENT_BUS_QUEUE_SIZE = int(os.getenv('EVENT_BUS_QUEUE_SIZE', 10000))
+    EVENT_BUS_BATCH_SIZE = int(os.getenv('EVENT_BUS_BATCH_SIZE', 100))
+    EVENT_BUS_MAX_RETRIES = int(os.getenv('EVENT_BUS_MAX_RETRIES', 5))
+    
     API_HOST = os.getenv('API_HOST', '0.0.0.0')
     API_PORT = int(os.getenv('API_PORT', 8000))
     
@@ -0,0 +1,76 @@
+import json
+import os
+import asyncio
+import logging
+import aiohttp
+from web3 import AsyncWeb3, AsyncHTTPProvider
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBlockchainClient:
+    """
+    Асинхронный аналог BlockchainClient на AsyncWeb3.
+
+    Все запросы идут через одну общую aiohttp-сессию, поэтому RPC из разных
+    корутин выполняются параллельно и не блокируют event loop.
+    Создается через `await AsyncBlockchainClient.create()`.
+    """
+    def __init__(self, session: aiohttp.ClientSession = None):
+        self.rpc_url = os.getenv("RPC_URL", "http://localhost:8545")
+        self.provider = AsyncHTTPProvider(self.rpc_url)
+        self.w3 = AsyncWeb3(self.provider)
+        self.session = session
+
+        self.contract_data_path = os.getenv("CONTRACT_DATA_PATH", "./contract_data/contract_info.json")
+        self.contract_data = None
+        self.raffle_contract = None
+
+    @classmethod
+    async def create(cls, session: aiohttp.ClientSession = None):
+        client = cls(session)
+        await client.connect()
+        return client
+
+    async def connect(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=config.RPC_CONNECTION_LIMIT)
+            )
+        await self.provider.cache_async_session(self.session)
+
+        await self._wait_for_connection()
+        self.raffle_contract = await self._load_dynamic_contract()
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+    async def _wait_for_connection(self):
+        while not await self.w3.is_connected():
+            logger.warning(f"Waiting for blockchain at {self.rpc_url}...")
+            await asyncio.sleep(2)
+        logger.info(f"✅ Connected to blockchain at {self.rpc_url} (async)")
+
+    async def _load_dynamic_contract(self):
+        while not os.path.exists(self.contract_data_path):
+            logger.warning(f"Waiting for contract file at {self.contract_data_path}...")
+            await asyncio.sleep(2)
+
+        try:
+            with open(self.contract_data_path, 'r') as f:
+                data = json.load(f)
+            self.contract_data = data
+
+            address = AsyncWeb3.to_checksum_address(data['address'])
+            abi = data['abi']
+
+            logger.info(f"✅ Loaded Raffle contract at {address} (async)")
+            return self.w3.eth.contract(address=address, abi=abi)
+        except Exception as e:
+            logger.error(f"Failed to load contract data: {e}")
+            raise e
+
+    def get_contract_by_address(self, address: str, abi: list):
+        return self.w3.eth.contract(address=AsyncWeb3.to_checksum_address(address), abi=abi)
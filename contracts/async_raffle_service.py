@@ -0,0 +1,41 @@
+# contracts/async_raffle_service.py
+
+import logging
+from config.settings import config
+from .async_blockchain_client import AsyncBlockchainClient
+from .raffle_service import ERC20_ABI
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRaffleService:
+    """
+    Асинхронный аналог RaffleService для слушателей событий.
+    Создается через `await AsyncRaffleService.create()`.
+    """
+    def __init__(self, client: AsyncBlockchainClient):
+        self.client = client
+        self.w3 = client.w3
+        self.raffle_contract = client.raffle_contract
+
+        json_usdt_address = client.contract_data.get('usdt_address')
+
+        if json_usdt_address:
+            logger.info(f"Using USDT address from JSON: {json_usdt_address}")
+            self.usdt_contract = client.get_contract_by_address(json_usdt_address, ERC20_ABI)
+        elif config.USDT_CONTRACT_ADDRESS:
+            self.usdt_contract = client.get_contract_by_address(config.USDT_CONTRACT_ADDRESS, ERC20_ABI)
+
+    @classmethod
+    async def create(cls, session=None):
+        client = await AsyncBlockchainClient.create(session)
+        return cls(client)
+
+    async def close(self):
+        await self.client.close()
+
+    async def get_entrance_fee(self) -> int:
+        return await self.raffle_contract.functions.s_depositAmount().call()
+
+    async def get_raffle_state(self) -> int:
+        return await self.raffle_contract.functions.s_raffleState().call()
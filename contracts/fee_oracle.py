@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from statistics import median
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Ответы ноды, по которым EIP-1559 считается неподдерживаемым (а не временным сбоем)
+FEE_HISTORY_UNSUPPORTED_ERRORS = (
+    'method not found',
+    'not supported',
+    'does not exist',
+    'not available',
+    'no basefeepergas',
+)
+
+
+def is_fee_history_unsupported(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in FEE_HISTORY_UNSUPPORTED_ERRORS)
+
+
+class FeeOracle:
+    """
+    Общий для всех отправителей источник chain_id и параметров комиссии.
+
+    chain_id запрашивается у сети один раз. Комиссия считается по выборке
+    eth_feeHistory за FEE_HISTORY_BLOCKS последних блоков и кешируется на
+    FEE_CACHE_TTL секунд (примерно один блок):
+        maxPriorityFeePerGas = медиана награды FEE_PRIORITY_PERCENTILE-го перцентиля
+        maxFeePerGas = 2 * baseFee следующего блока + maxPriorityFeePerGas
+    Если сеть не поддерживает EIP-1559, используется закешированный gasPrice,
+    а eth_feeHistory пробуется снова через FEE_EIP1559_REPROBE_SECONDS. Временный
+    сбой eth_feeHistory переводит на gasPrice только текущий вызов.
+    """
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl if ttl is not None else config.FEE_CACHE_TTL
+        self._lock = threading.Lock()
+        self._chain_id = None
+        self._fees = None
+        self._fees_at = 0.0
+        self._eip1559 = config.USE_EIP1559
+        self._reprobe_at = 0.0
+
+    def chain_id(self, w3) -> int:
+        if self._chain_id is None:
+            with self._lock:
+                if self._chain_id is None:
+                    self._chain_id = w3.eth.chain_id
+        return self._chain_id
+
+    def fee_params(self, w3) -> dict:
+        """Параметры комиссии для tx_params: maxFeePerGas/maxPriorityFeePerGas или gasPrice"""
+        with self._lock:
+            if self._fees is None or time.monotonic() - self._fees_at >= self.ttl:
+                fees, cacheable = self._fetch(w3)
+                if not cacheable:
+                    return fees
+                self._fees = fees
+                self._fees_at = time.monotonic()
+            return dict(self._fees)
+
+    def _fetch(self, w3) -> tuple:
+        """
+        Returns:
+            (параметры комиссии, можно ли их кешировать)
+        """
+        if not self._eip1559 and config.USE_EIP1559 and time.monotonic() >= self._reprobe_at:
+            self._eip1559 = True
+
+        if self._eip1559:
+            try:
+                return self._fetch_eip1559(w3), True
+            except Exception as e:
+                if not is_fee_history_unsupported(e):
+                    logger.warning(f"eth_feeHistory failed, using legacy gasPrice for this call: {e}")
+                    return {'gasPrice': w3.eth.gas_price}, False
+                logger.warning(
+                    f"eth_feeHistory is not supported, using legacy gasPrice for "
+                    f"{config.FEE_EIP1559_REPROBE_SECONDS:.0f}s: {e}"
+                )
+                self._eip1559 = False
+                self._reprobe_at = time.monotonic() + config.FEE_EIP1559_REPROBE_SECONDS
+        return {'gasPrice': w3.eth.gas_price}, True
+
+    def _fetch_eip1559(self, w3) -> dict:
+        history = w3.eth.fee_history(config.FEE_HISTORY_BLOCKS, 'latest', [config.FEE_PRIORITY_PERCENTILE])
+
+        base_fees = history['baseFeePerGas']
+        if not base_fees or base_fees[-1] is None:
+            raise ValueError("fee history has no baseFeePerGas")
+        # Последний элемент - baseFee следующего (еще не созданного) блока
+        next_base_fee = base_fees[-1]
+
+        rewards = [block_rewards[0] for block_rewards in history.get('reward') or [] if block_rewards]
+        priority_fee = max(int(median(rewards)) if rewards else 0, config.MIN_PRIORITY_FEE)
+
+        logger.debug(f"Fee oracle: base fee {next_base_fee}, priority fee {priority_fee}")
+        return {
+            'maxFeePerGas': 2 * next_base_fee + priority_fee,
+            'maxPriorityFeePerGas': priority_fee
+        }
+
+
+fee_oracle = FeeOracle()
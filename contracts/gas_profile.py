@@ -0,0 +1,79 @@
+import logging
+import threading
+from collections import deque, OrderedDict
+from statistics import mean, pstdev
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACKED_TRANSACTIONS = 10000
+
+
+def shape_class(data: str) -> int:
+    """
+    Класс формы calldata: число 32-байтных слов аргументов.
+    Длинные (динамические) аргументы группируются по степеням двойки.
+    """
+    words = max(len(data) - 10, 0) // 64
+    if words <= 8:
+        return words
+    return 1 << (words - 1).bit_length()
+
+
+class GasProfileCache:
+    """
+    Лимиты газа, выученные по фактическому gasUsed из receipt.
+
+    Ключ - (адрес контракта, селектор функции, класс формы calldata). Для ключа
+    хранится окно последних GAS_PROFILE_WINDOW значений gasUsed. Лимит выдается,
+    только когда наблюдений достаточно и разброс мал; иначе вызывающий код
+    делает обычный estimate_gas.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}              # key -> deque(gasUsed)
+        self._pending = OrderedDict()   # tx_hash -> key
+
+    @staticmethod
+    def key(to: str, data: str) -> tuple:
+        return (to.lower(), data[:10], shape_class(data))
+
+    def gas_limit(self, key: tuple):
+        """Лимит газа для ключа или None, если нужен живой estimate_gas"""
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+
+        if len(samples) < config.GAS_PROFILE_MIN_SAMPLES:
+            return None
+
+        avg = mean(samples)
+        deviation = pstdev(samples)
+        if deviation / avg > config.GAS_PROFILE_MAX_VARIATION:
+            logger.debug(f"Gas profile {key} is unstable (std {deviation:.0f}, mean {avg:.0f})")
+            return None
+
+        return int(max(max(samples), avg + 3 * deviation) * config.GAS_PROFILE_MARGIN)
+
+    def track(self, tx_hash: str, key: tuple):
+        """Запомнить ключ отправленной транзакции до получения receipt"""
+        with self._lock:
+            self._pending[tx_hash] = key
+            while len(self._pending) > MAX_TRACKED_TRANSACTIONS:
+                self._pending.popitem(last=False)
+
+    def observe(self, tx_hash: str, receipt):
+        """Учесть gasUsed успешной транзакции (повторный вызов для того же хеша ничего не делает)"""
+        with self._lock:
+            key = self._pending.pop(tx_hash, None)
+            if key is None or receipt['status'] != 1:
+                return
+            samples = self._samples.setdefault(key, deque(maxlen=config.GAS_PROFILE_WINDOW))
+            samples.append(receipt['gasUsed'])
+
+    def observe_receipts(self, receipts: dict):
+        """Слушатель ReceiptTracker: tx_hash -> receipt"""
+        for tx_hash, receipt in receipts.items():
+            self.observe(tx_hash, receipt)
+
+
+gas_profiles = GasProfileCache()
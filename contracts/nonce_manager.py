@@ -0,0 +1,72 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 'invalid nonce' не подходит: так же ноды сообщают и о слишком большом nonce
+NONCE_TOO_LOW_ERRORS = (
+    'nonce too low',
+)
+
+# Нода уже держит в mempool эту же подписанную транзакцию
+ALREADY_KNOWN_ERRORS = (
+    'already known',
+)
+
+
+def is_nonce_too_low(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_TOO_LOW_ERRORS)
+
+
+def is_already_known(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in ALREADY_KNOWN_ERRORS)
+
+
+class NonceManager:
+    """
+    Локальный аллокатор nonce для адресов, от которых отправляются транзакции.
+
+    Nonce берется из сети (pending) один раз на адрес, дальше выдается из
+    локального счетчика под блокировкой адреса, поэтому несколько транзакций
+    одного аккаунта могут быть в полете одновременно без лишних RPC.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._address_locks = {}
+        self._next_nonce = {}
+
+    def _address_lock(self, address: str) -> threading.Lock:
+        with self._lock:
+            return self._address_locks.setdefault(address, threading.Lock())
+
+    def allocate(self, w3, address: str) -> int:
+        """Выдать следующий nonce для адреса"""
+        with self._address_lock(address):
+            if address not in self._next_nonce:
+                self._next_nonce[address] = w3.eth.get_transaction_count(address, 'pending')
+            nonce = self._next_nonce[address]
+            self._next_nonce[address] = nonce + 1
+            return nonce
+
+    def release(self, address: str, nonce: int):
+        """
+        Вернуть nonce, если транзакция так и не была отправлена.
+        Если после него уже выданы другие nonce, счетчик сбрасывается
+        и будет заново синхронизирован с сетью.
+        """
+        with self._address_lock(address):
+            if self._next_nonce.get(address) == nonce + 1:
+                self._next_nonce[address] = nonce
+            else:
+                self._next_nonce.pop(address, None)
+
+    def resync(self, w3, address: str):
+        """Синхронизировать счетчик с сетью (после ошибки 'nonce too low')"""
+        with self._address_lock(address):
+            self._next_nonce[address] = w3.eth.get_transaction_count(address, 'pending')
+            logger.info(f"Nonce for {address} resynced to {self._next_nonce[address]}")
+
+
+nonce_manager = NonceManager()
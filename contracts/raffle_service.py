@@ -1,12 +1,22 @@
 # contracts/raffle_service.py
 
 import logging
+import threading
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from config.settings import config
 from .blockchain_client import BlockchainClient
+from .nonce_manager import nonce_manager, is_nonce_too_low, is_already_known
+from .receipt_tracker import receipt_tracker
+from .fee_oracle import fee_oracle
+from .gas_profile import gas_profiles
+from .raffle_snapshot import RaffleSnapshotReader, RaffleSnapshot
+from .rpc_batch import JsonRpcBatchClient, JsonRpcError
 
 logger = logging.getLogger(__name__)
 
+receipt_tracker.add_listener(gas_profiles.observe_receipts)
+
 ERC20_ABI = [
     {"type": "function", "name": "approve",
      "inputs": [{"name": "spender", "type": "address"}, {"name": "amount", "type": "uint256"}],
@@ -47,60 +57,193 @@ class RaffleService:
         self.admin_address = Web3.to_checksum_address(config.ADMIN_PUBLIC_ADDRESS)
         self.admin_key = config.ADMIN_PRIVATE_KEY
 
+        self.rpc = JsonRpcBatchClient(self.client.rpc_url)
+        self.snapshot_reader = RaffleSnapshotReader(self.w3, self.raffle_contract, self.rpc)
+
+        # allowance адресов пользователей для raffle-контракта, известные после approve/deposit
+        self._allowances = {}
+        self._allowances_lock = threading.Lock()
+
     def get_entrance_fee(self) -> int:
         return self.raffle_contract.functions.s_depositAmount().call()
 
     def get_raffle_state(self) -> int:
         return self.raffle_contract.functions.s_raffleState().call()
 
-    def enter_raffle(self, user_address: str, user_private_key: str) -> str:
+    def get_usdt_balance(self, address: str) -> int:
+        return self.usdt_contract.functions.balanceOf(Web3.to_checksum_address(address)).call()
+
+    def get_usdt_balances(self, addresses: list, block_number: int = None) -> tuple:
+        """
+        Балансы USDT многих адресов на одном блоке через JSON-RPC batch
+
+        Returns:
+            ({address: баланс или None при ошибке}, block_number)
+        """
+        if block_number is None:
+            block_number = self.w3.eth.block_number
+
+        usdt_address = self.usdt_contract.address
+        results = self.rpc.batch([
+            ('eth_call', [{
+                'to': usdt_address,
+                'data': self.usdt_contract.encodeABI(fn_name='balanceOf',
+                                                     args=[Web3.to_checksum_address(address)])
+            }, hex(block_number)])
+            for address in addresses
+        ])
+
+        balances = {}
+        for address, result in zip(addresses, results):
+            if isinstance(result, JsonRpcError):
+                logger.warning(f"balanceOf({address}) failed: {result}")
+                balances[address] = None
+            else:
+                balances[address] = Web3.to_int(hexstr=result)
+        return balances, block_number
+
+    def get_snapshot(self) -> RaffleSnapshot:
+        """Состояние текущей лотереи на одном блоке за один запрос к ноде"""
+        return self.snapshot_reader.read()
+
+    def enter_raffle(self, user_address: str, user_private_key: str = None, wait: bool = True,
+                     balance: int = None, entrance_fee: int = None, signer=None) -> str:
+        """
+        Вход в лотерею (approve при необходимости + deposit)
+
+        Args:
+            wait: Ждать receipt каждой транзакции. При wait=False обе транзакции
+                только подписываются и отправляются с последовательными nonce
+            balance: Баланс USDT, если уже известен (иначе читается balanceOf).
+                allowance читается из сети только при первом входе адреса, дальше
+                берется из кеша, который обновляют approve и deposit
+            entrance_fee: Размер депозита, если уже известен
+            signer: signer(transaction) -> raw bytes подписанной транзакции;
+                используется вместо user_private_key (например, пул процессов подписи)
+        """
         user_address = Web3.to_checksum_address(user_address)
-        entrance_fee = self.get_entrance_fee()
+        if entrance_fee is None:
+            entrance_fee = self.get_entrance_fee()
+        approve_pending = False
+        allowance = None
 
         if hasattr(self, 'usdt_contract'):
-            balance = self.usdt_contract.functions.balanceOf(user_address).call()
+            if balance is None:
+                balance = self.usdt_contract.functions.balanceOf(user_address).call()
             if balance < entrance_fee:
                 raise ValueError(f"Insufficient USDT balance. Have: {balance}, Need: {entrance_fee}")
 
-            allowance = self.usdt_contract.functions.allowance(user_address, self.raffle_contract.address).call()
+            with self._allowances_lock:
+                allowance = self._allowances.get(user_address)
+            if allowance is None:
+                allowance = self.usdt_contract.functions.allowance(user_address, self.raffle_contract.address).call()
 
-            if allowance < entrance_fee:
+        try:
+            if allowance is not None and allowance < entrance_fee:
                 logger.info("Approving USDT...")
                 self._send_transaction(
                     self.usdt_contract.functions.approve(self.raffle_contract.address, entrance_fee),
                     user_address,
-                    user_private_key
+                    user_private_key,
+                    wait=wait,
+                    signer=signer
                 )
-
-        logger.info(f"Entering raffle for {user_address}...")
-        tx_hash = self._send_transaction(
-            self.raffle_contract.functions.deposit(),
-            user_address,
-            user_private_key,
-        )
+                approve_pending = not wait
+                allowance = entrance_fee
+
+            logger.info(f"Entering raffle for {user_address}...")
+            tx_hash = self._send_transaction(
+                self.raffle_contract.functions.deposit(),
+                user_address,
+                user_private_key,
+                wait=wait,
+                # Пока approve не замайнен, estimate_gas для deposit ревертится
+                default_gas=config.DEPOSIT_GAS_LIMIT if approve_pending else None,
+                signer=signer
+            )
+        except Exception:
+            # Состояние approve неизвестно - при следующем входе allowance читается из сети
+            with self._allowances_lock:
+                self._allowances.pop(user_address, None)
+            raise
+
+        if allowance is not None:
+            # deposit списывает entrance_fee через transferFrom
+            with self._allowances_lock:
+                self._allowances[user_address] = allowance - entrance_fee
         return tx_hash
 
-    def _send_transaction(self, function_call, from_address, private_key, value=0):
-        nonce = self.w3.eth.get_transaction_count(from_address)
-
-        tx_params = {
-            'from': from_address,
-            'nonce': nonce,
-            'gasPrice': self.w3.eth.gas_price,
-            'value': value,
-            'chainId': self.w3.eth.chain_id
-        }
-
-        gas_estimate = function_call.estimate_gas(tx_params)
-        tx_params['gas'] = int(gas_estimate * 1.2)
-
-        transaction = function_call.build_transaction(tx_params)
-
-        signed_tx = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        if receipt.status != 1:
+    def get_receipt(self, tx_hash: str):
+        """Receipt транзакции или None, если она еще не замайнена"""
+        try:
+            receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+        gas_profiles.observe(tx_hash, receipt)
+        return receipt
+
+    def _send_transaction(self, function_call, from_address, private_key=None, value=0,
+                          wait=True, gas=None, default_gas=None, retry_nonce=True, signer=None):
+        """
+        Подписать и отправить транзакцию
+
+        Подпись - signer(transaction), если он задан, иначе private_key.
+        Лимит газа: gas, если задан; иначе из кеша профилей газа; иначе
+        default_gas; иначе estimate_gas + 20%.
+        """
+        nonce = nonce_manager.allocate(self.w3, from_address)
+        raw_transaction = None
+
+        try:
+            tx_params = {
+                'from': from_address,
+                'nonce': nonce,
+                'value': value,
+                'chainId': fee_oracle.chain_id(self.w3),
+                **fee_oracle.fee_params(self.w3)
+            }
+
+            transaction = function_call.build_transaction({**tx_params, 'gas': gas or 0})
+            profile_key = gas_profiles.key(transaction['to'], transaction['data'])
+
+            if gas is None:
+                gas = gas_profiles.gas_limit(profile_key) or default_gas
+            if gas is None:
+                gas_estimate = function_call.estimate_gas(tx_params)
+                gas = int(gas_estimate * 1.2)
+            transaction['gas'] = gas
+
+            if signer is not None:
+                raw_transaction = signer(transaction)
+            else:
+                raw_transaction = self.w3.eth.account.sign_transaction(transaction, private_key).rawTransaction
+            tx_hash = self.w3.eth.send_raw_transaction(raw_transaction)
+        except Exception as e:
+            if raw_transaction is not None and is_already_known(e):
+                # Та же подписанная транзакция уже в mempool: переподписывать нельзя,
+                # иначе тот же перевод уйдет второй раз с другим nonce
+                tx_hash = Web3.keccak(raw_transaction)
+                logger.info(f"Transaction {tx_hash.hex()} is already known to the node")
+            elif retry_nonce and is_nonce_too_low(e):
+                logger.warning(f"Nonce {nonce} too low for {from_address}, resyncing")
+                nonce_manager.resync(self.w3, from_address)
+                return self._send_transaction(function_call, from_address, private_key, value,
+                                              wait=wait, gas=gas, default_gas=default_gas,
+                                              retry_nonce=False, signer=signer)
+            else:
+                nonce_manager.release(from_address, nonce)
+                raise
+
+        gas_profiles.track(tx_hash.hex(), profile_key)
+        if not wait:
+            return tx_hash.hex()
+
+        if receipt_tracker.is_running:
+            receipt = receipt_tracker.wait(tx_hash.hex())
+        else:
+            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        gas_profiles.observe(tx_hash.hex(), receipt)
+        if receipt['status'] != 1:
             raise Exception(f"Transaction failed: {receipt}")
 
         return tx_hash.hex()
@@ -0,0 +1,143 @@
+import logging
+from web3 import Web3
+from config.settings import config
+from .rpc_batch import JsonRpcBatchClient, JsonRpcError
+
+logger = logging.getLogger(__name__)
+
+MULTICALL3_ABI = [
+    {"type": "function", "name": "aggregate3",
+     "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+         {"name": "target", "type": "address"},
+         {"name": "allowFailure", "type": "bool"},
+         {"name": "callData", "type": "bytes"}]}],
+     "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+         {"name": "success", "type": "bool"},
+         {"name": "returnData", "type": "bytes"}]}],
+     "stateMutability": "payable"},
+    {"type": "function", "name": "getBlockNumber", "inputs": [],
+     "outputs": [{"name": "blockNumber", "type": "uint256"}], "stateMutability": "view"},
+]
+
+RAFFLE_STATES = {0: "OPEN", 1: "CALCULATING"}
+
+# (функция контракта, типы результата)
+SNAPSHOT_CALLS = [
+    ('getRaffleInfo', ['(uint256,uint256,uint256,uint256,uint256,address,bool)']),
+    ('s_currentRaffleId', ['uint256']),
+    ('s_raffleState', ['uint8']),
+    ('getParticipantsCount', ['uint256']),
+    ('getPrizePool', ['uint256']),
+    ('getTimeRemaining', ['uint256']),
+    ('s_protocolFeeBps', ['uint256']),
+]
+
+
+class RaffleSnapshot:
+    """Состояние текущей лотереи, прочитанное на одном блоке"""
+    def __init__(self, block_number: int, values: dict):
+        self.block_number = block_number
+
+        info = values.get('getRaffleInfo') or (None,) * 7
+        self.raffle_id = values.get('s_currentRaffleId', info[0])
+        self.deposit_amount = info[1]
+        self.start_time = info[2]
+        self.end_time = info[3]
+        self.total_deposits = info[4]
+        self.winner = info[5]
+        self.claimed = info[6]
+
+        self.state = values.get('s_raffleState')
+        self.participants_count = values.get('getParticipantsCount')
+        self.prize_pool = values.get('getPrizePool')
+        self.time_remaining = values.get('getTimeRemaining')
+        self.protocol_fee_bps = values.get('s_protocolFeeBps')
+
+    def to_dict(self):
+        return {
+            'raffle_id': self.raffle_id,
+            'state': RAFFLE_STATES.get(self.state, 'UNKNOWN'),
+            'deposit_amount': self.deposit_amount,
+            'participants_count': self.participants_count,
+            'prize_pool': self.prize_pool,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'time_remaining': self.time_remaining,
+            'total_deposits': self.total_deposits,
+            'winner': self.winner,
+            'claimed': self.claimed,
+            'block_number': self.block_number
+        }
+
+
+class RaffleSnapshotReader:
+    """
+    Чтение RaffleSnapshot за один запрос к ноде.
+
+    Если по MULTICALL3_ADDRESS развернут Multicall3, все view-функции и номер
+    блока читаются одним eth_call aggregate3. Иначе вызовы отправляются одним
+    JSON-RPC batch с eth_call на зафиксированном номере блока.
+    """
+    def __init__(self, w3, raffle_contract, rpc: JsonRpcBatchClient = None):
+        self.w3 = w3
+        self.raffle_contract = raffle_contract
+        self.rpc = rpc or JsonRpcBatchClient()
+        self._multicall = None
+        self._multicall_checked = False
+
+    def _get_multicall(self):
+        if not self._multicall_checked:
+            self._multicall_checked = True
+            if config.MULTICALL3_ADDRESS:
+                address = Web3.to_checksum_address(config.MULTICALL3_ADDRESS)
+                if self.w3.eth.get_code(address):
+                    self._multicall = self.w3.eth.contract(address=address, abi=MULTICALL3_ABI)
+                else:
+                    logger.info(f"Multicall3 is not deployed at {address}, using JSON-RPC batch")
+        return self._multicall
+
+    def _decode(self, name: str, types: list, data: bytes):
+        try:
+            decoded = self.w3.codec.decode(types, data)
+        except Exception as e:
+            logger.warning(f"Cannot decode {name}: {e}")
+            return None
+        return decoded[0]
+
+    def read(self) -> RaffleSnapshot:
+        multicall = self._get_multicall()
+        if multicall is not None:
+            return self._read_multicall(multicall)
+        return self._read_batch()
+
+    def _read_multicall(self, multicall) -> RaffleSnapshot:
+        calls = [(multicall.address, False, multicall.encodeABI(fn_name='getBlockNumber'))]
+        calls += [
+            (self.raffle_contract.address, True, self.raffle_contract.encodeABI(fn_name=name))
+            for name, _ in SNAPSHOT_CALLS
+        ]
+        results = multicall.functions.aggregate3(calls).call()
+
+        block_number = self._decode('getBlockNumber', ['uint256'], results[0][1])
+        values = {}
+        for (name, types), (success, data) in zip(SNAPSHOT_CALLS, results[1:]):
+            if success:
+                values[name] = self._decode(name, types, data)
+        return RaffleSnapshot(block_number, values)
+
+    def _read_batch(self) -> RaffleSnapshot:
+        block_number = self.w3.eth.block_number
+        block = hex(block_number)
+        results = self.rpc.batch([
+            ('eth_call', [{'to': self.raffle_contract.address,
+                           'data': self.raffle_contract.encodeABI(fn_name=name)}, block])
+            for name, _ in SNAPSHOT_CALLS
+        ])
+
+        values = {}
+        for (name, types), result in zip(SNAPSHOT_CALLS, results):
+            if isinstance(result, JsonRpcError):
+                logger.warning(f"{name} failed: {result}")
+            elif result:
+                values[name] = self._decode(name, types, Web3.to_bytes(hexstr=result))
+        return RaffleSnapshot(block_number, values)
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from config.settings import config
+from database.db_service import TransactionService
+from .rpc_batch import JsonRpcBatchClient, JsonRpcError
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_receipt(raw: dict) -> dict:
+    """Receipt из сырого JSON-RPC ответа (hex-строки) в dict с int полями"""
+    return {
+        'transactionHash': raw['transactionHash'],
+        'blockHash': raw['blockHash'],
+        'blockNumber': int(raw['blockNumber'], 16),
+        'gasUsed': int(raw['gasUsed'], 16),
+        'status': int(raw.get('status', '0x1'), 16),
+    }
+
+
+class ReceiptTracker:
+    """
+    Фоновый поток, отслеживающий receipt всех транзакций в полете.
+
+    Набор ожидаемых хешей - транзакции PENDING без блока из БД и хеши,
+    которых ждут вызовы wait(). Каждый тик все они проверяются одним
+    JSON-RPC batch запросом eth_getTransactionReceipt; найденные receipt
+    записываются в transactions/entry_jobs, а ожидающие потоки просыпаются.
+    Транзакции без receipt дольше RECEIPT_MAX_AGE помечаются FAILED и больше
+    не опрашиваются.
+    """
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval or config.RECEIPT_POLL_INTERVAL
+        self.rpc = JsonRpcBatchClient()
+        self._lock = threading.Lock()
+        self._waiters = {}   # tx_hash -> threading.Event
+        self._receipts = {}  # tx_hash -> receipt для ожидающих
+        self._listeners = []
+        self._last_expire = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.is_running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='receipt-tracker', daemon=True)
+            self._thread.start()
+        logger.info("Receipt tracker started")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval * 2)
+
+    def add_listener(self, callback):
+        """callback(receipts) вызывается после каждого тика с найденными receipt (tx_hash -> receipt)"""
+        self._listeners.append(callback)
+
+    def wait(self, tx_hash: str, timeout: float = None) -> dict:
+        """Дождаться receipt транзакции (без собственного цикла опроса RPC)"""
+        with self._lock:
+            if tx_hash in self._receipts:
+                return self._receipts.pop(tx_hash)
+            event = self._waiters.setdefault(tx_hash, threading.Event())
+
+        if not event.wait(timeout or config.RECEIPT_TIMEOUT):
+            with self._lock:
+                self._waiters.pop(tx_hash, None)
+            raise TimeoutError(f"Transaction {tx_hash} is not mined after {timeout or config.RECEIPT_TIMEOUT}s")
+
+        with self._lock:
+            self._waiters.pop(tx_hash, None)
+            return self._receipts.pop(tx_hash)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error in receipt tracker: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def tick(self) -> int:
+        """
+        Проверить все транзакции в полете одним batch запросом
+
+        Returns:
+            Количество найденных receipt
+        """
+        # Выброшенные транзакции ищутся не чаще раза в RECEIPT_TIMEOUT
+        if time.monotonic() - self._last_expire >= config.RECEIPT_TIMEOUT:
+            TransactionService.expire_unmined(config.RECEIPT_MAX_AGE)
+            self._last_expire = time.monotonic()
+        with self._lock:
+            hashes = set(self._waiters)
+        hashes.update(TransactionService.get_unmined_hashes())
+        if not hashes:
+            return 0
+
+        hashes = sorted(hashes)
+        results = self.rpc.batch([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in hashes])
+
+        receipts = {}
+        for tx_hash, result in zip(hashes, results):
+            if isinstance(result, JsonRpcError):
+                logger.warning(f"Receipt request for {tx_hash} failed: {result}")
+            elif result:
+                receipts[tx_hash] = normalize_receipt(result)
+
+        if not receipts:
+            return 0
+
+        TransactionService.apply_receipts(receipts)
+
+        for callback in self._listeners:
+            try:
+                callback(receipts)
+            except Exception as e:
+                logger.error(f"Receipt listener error: {e}")
+
+        with self._lock:
+            for tx_hash, receipt in receipts.items():
+                event = self._waiters.get(tx_hash)
+                if event:
+                    self._receipts[tx_hash] = receipt
+                    event.set()
+
+        logger.info(f"Receipt tracker: {len(receipts)}/{len(hashes)} transactions mined")
+        return len(receipts)
+
+
+receipt_tracker = ReceiptTracker()
@@ -0,0 +1,64 @@
+import logging
+import os
+import itertools
+import requests
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class JsonRpcError(Exception):
+    pass
+
+
+class JsonRpcBatchClient:
+    """
+    Отправка нескольких JSON-RPC вызовов одним HTTP-запросом.
+    Большие пачки делятся на части по RPC_BATCH_SIZE вызовов.
+    """
+    def __init__(self, rpc_url: str = None):
+        self.rpc_url = rpc_url or os.getenv("RPC_URL", "http://localhost:8545")
+        self.session = requests.Session()
+        self._ids = itertools.count(1)
+
+    def batch(self, calls: list) -> list:
+        """
+        Выполнить вызовы пачками
+
+        Args:
+            calls: [(method, params), ...]
+
+        Returns:
+            Результаты в том же порядке; для вызовов с ошибкой - экземпляр JsonRpcError
+        """
+        results = []
+        for i in range(0, len(calls), config.RPC_BATCH_SIZE):
+            results.extend(self._send(calls[i:i + config.RPC_BATCH_SIZE]))
+        return results
+
+    def _send(self, calls: list) -> list:
+        payload = [
+            {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params}
+            for method, params in calls
+        ]
+        response = self.session.post(self.rpc_url, json=payload, timeout=30)
+        response.raise_for_status()
+
+        by_id = {item.get('id'): item for item in response.json()}
+        results = []
+        for request in payload:
+            item = by_id.get(request['id'])
+            if item is None:
+                results.append(JsonRpcError(f"No response for {request['method']}"))
+            elif 'error' in item:
+                results.append(JsonRpcError(item['error'].get('message', str(item['error']))))
+            else:
+                results.append(item.get('result'))
+        return results
+
+    def call(self, method: str, params: list):
+        """Один вызов (ошибка пробрасывается исключением)"""
+        result = self._send([(method, params)])[0]
+        if isinstance(result, JsonRpcError):
+            raise result
+        return result
@@ -0,0 +1,101 @@
+import logging
+import threading
+from datetime import timedelta
+from config.settings import config
+from database.models import db_manager, User
+
+logger = logging.getLogger(__name__)
+
+
+class AddressIndex:
+    """
+    In-memory индекс адресов пользователей: 20 байт адреса -> tg_id.
+
+    Загружается из таблицы users один раз, затем дополняется инкрементально:
+    UserService.create_user добавляет адрес сразу, а пользователи, созданные
+    в другом процессе, подтягиваются refresh() по created_at с перекрытием
+    ADDRESS_INDEX_OVERLAP_SECONDS: id и created_at назначаются до COMMIT, поэтому
+    конкурентные транзакции становятся видны не по порядку, и граница "больше
+    последнего загруженного" теряла бы пользователей. Поиск только читает память;
+    refresh() вызывают фоновые потоки (LogIngestor, Backfiller, BalanceLedger) на каждом опросе.
+
+    Ключи - сырые bytes, числовые tg_id хранятся как int, поэтому
+    на миллион пользователей индекс занимает порядка сотни мегабайт.
+    """
+    def __init__(self, overlap_seconds: float = 300.0):
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self._lock = threading.Lock()
+        self._by_address = {}
+        self._addresses = []  # в порядке добавления, для фильтров по topic
+        self._last_created_at = None
+
+    @staticmethod
+    def normalize(address) -> bytes:
+        """Адрес (строка 0x... в любом регистре или bytes) -> 20 байт"""
+        if isinstance(address, (bytes, bytearray)):
+            raw = bytes(address[-20:])
+        else:
+            raw = bytes.fromhex(address[2:] if address.startswith(('0x', '0X')) else address)
+        if len(raw) != 20:
+            raise ValueError(f"Invalid EVM address: {address}")
+        return raw
+
+    def _add(self, raw: bytes, tg_id: str) -> bool:
+        is_new = raw not in self._by_address
+        if is_new:
+            self._addresses.append(raw)
+        self._by_address[raw] = int(tg_id) if tg_id.isdigit() else tg_id
+        return is_new
+
+    def add(self, evm_address: str, tg_id: str):
+        """Добавить адрес пользователя (вызывается из UserService.create_user)"""
+        with self._lock:
+            self._add(self.normalize(evm_address), str(tg_id))
+
+    def refresh(self) -> int:
+        """
+        Подгрузить пользователей, созданных не раньше последней загрузки
+        минус окно перекрытия (первый вызов загружает всю таблицу)
+
+        Returns:
+            Количество новых записей
+        """
+        session = db_manager.get_session()
+        try:
+            query = session.query(User.evm_address, User.tg_id, User.created_at)
+            if self._last_created_at is not None:
+                query = query.filter(User.created_at >= self._last_created_at - self.overlap)
+            rows = query.all()
+        finally:
+            session.close()
+
+        added = 0
+        with self._lock:
+            for evm_address, tg_id, created_at in rows:
+                if self._add(self.normalize(evm_address), str(tg_id)):
+                    added += 1
+                if created_at is not None and (self._last_created_at is None or created_at > self._last_created_at):
+                    self._last_created_at = created_at
+
+        if added:
+            logger.info(f"Address index: +{added} users, {len(self._by_address)} total")
+        return added
+
+    def get_tg_id(self, evm_address):
+        """tg_id владельца адреса или None, если адрес не наш"""
+        tg_id = self._by_address.get(self.normalize(evm_address))
+        return str(tg_id) if tg_id is not None else None
+
+    def __contains__(self, evm_address) -> bool:
+        return self.normalize(evm_address) in self._by_address
+
+    def __len__(self) -> int:
+        return len(self._by_address)
+
+    def addresses_since(self, position: int) -> list:
+        """Адреса (20 байт), добавленные начиная с позиции position"""
+        with self._lock:
+            return self._addresses[position:]
+
+
+address_index = AddressIndex(config.ADDRESS_INDEX_OVERLAP_SECONDS)
@@ -0,0 +1,427 @@
+import logging
+from datetime import datetime
+from sqlalchemy import event, select, update, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database.models import User, Raffle, Transaction, BlockCursor, BlockHash, EntryJob, engine_options, _configure_sqlite
+from database.db_service import TransactionService, CursorService, EventBatch
+from database.address_index import address_index
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg'
+}
+
+
+def async_database_url(database_url: str):
+    """URL с async-драйвером для того же бэкенда (sqlite -> aiosqlite, postgresql -> asyncpg)"""
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver for {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+
+class AsyncDatabaseManager:
+    """
+    Async-движок для процесса слушателей на тех же моделях, что и db_manager.
+    Движок создается при первом обращении: процессам без слушателей
+    async-драйвер не нужен.
+    """
+    def __init__(self):
+        self.engine = None
+        self.Session = None
+
+    def _connect(self):
+        if config.ASYNC_DATABASE_URL:
+            url = make_url(config.ASYNC_DATABASE_URL)
+        else:
+            url = async_database_url(config.DATABASE_URL)
+        self.engine = create_async_engine(url, echo=False, **engine_options(url))
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            event.listen(self.engine.sync_engine, 'connect', _configure_sqlite)
+        # Объекты остаются читаемыми после commit без повторной загрузки
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        logger.info(f"Async database initialized: {url.render_as_string(hide_password=True)}")
+
+    def get_session(self):
+        if self.engine is None:
+            self._connect()
+        return self.Session()
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+async_db_manager = AsyncDatabaseManager()
+
+
+class AsyncUserService:
+    @staticmethod
+    async def create_user(tg_id: str, evm_address: str, encrypted_key: str = None, hd_index: int = None) -> User:
+        """Создать нового пользователя (с зашифрованным ключом или индексом HD-кошелька)"""
+        session = async_db_manager.get_session()
+        try:
+            user = User(
+                tg_id=tg_id,
+                evm_address=evm_address,
+                encrypted_private_key=encrypted_key,
+                hd_index=hd_index
+            )
+            session.add(user)
+            await session.commit()
+            address_index.add(evm_address, tg_id)
+            logger.info(f"Created user: {tg_id}")
+            return user
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error creating user: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def get_user_by_tg_id(tg_id: str) -> User:
+        """Получить пользователя по Telegram ID"""
+        session = async_db_manager.get_session()
+        try:
+            return await session.scalar(select(User).where(User.tg_id == str(tg_id)))
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def get_users_by_tg_ids(tg_ids: list) -> dict:
+        """Пользователи по списку Telegram ID одним запросом: tg_id -> User"""
+        session = async_db_manager.get_session()
+        try:
+            users = await session.scalars(select(User).where(User.tg_id.in_([str(tg_id) for tg_id in tg_ids])))
+            return {user.tg_id: user for user in users}
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def get_user_by_address(evm_address: str) -> User:
+        """Получить пользователя по EVM адресу"""
+        session = async_db_manager.get_session()
+        try:
+            return await session.scalar(select(User).where(User.evm_address == evm_address))
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def update_user_deposit(tg_id: str, amount: int, tx_hash: str = None):
+        """Обновить статус депозита"""
+        session = async_db_manager.get_session()
+        try:
+            result = await session.execute(
+                update(User).where(User.tg_id == str(tg_id)).values(deposit_amount=amount, deposit_tx_hash=tx_hash)
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Updated deposit for {tg_id}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error updating user deposit: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def mark_in_raffle(tg_id: str):
+        """Отметить пользователя как участника текущей лотереи"""
+        session = async_db_manager.get_session()
+        try:
+            result = await session.execute(
+                update(User).where(User.tg_id == str(tg_id)).values(
+                    is_in_current_raffle=True,
+                    total_entries=User.total_entries + 1
+                )
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Marked {tg_id} as in raffle")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error marking user in raffle: {e}")
+            raise
+        finally:
+            await session.close()
+
+
+class AsyncRaffleService:
+    @staticmethod
+    async def create_raffle(raffle_id: int) -> Raffle:
+        """Создать новую лотерею"""
+        session = async_db_manager.get_session()
+        try:
+            raffle = Raffle(raffle_id=raffle_id, status='OPEN')
+            session.add(raffle)
+            await session.commit()
+            logger.info(f"Created raffle: {raffle_id}")
+            return raffle
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error creating raffle: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def get_current_raffle() -> Raffle:
+        """Получить текущую (открытую) лотерею"""
+        session = async_db_manager.get_session()
+        try:
+            return await session.scalar(
+                select(Raffle).where(Raffle.status.in_(['OPEN', 'CALCULATING'])).order_by(Raffle.id.desc()).limit(1)
+            )
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def update_raffle_participant_count(raffle_id: int, count: int):
+        """Обновить количество участников"""
+        session = async_db_manager.get_session()
+        try:
+            result = await session.execute(
+                update(Raffle).where(Raffle.raffle_id == raffle_id).values(total_participants=count)
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Updated raffle {raffle_id} participants: {count}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error updating raffle: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def mark_raffle_calculating(raffle_id: int, vrf_request_id: str = None):
+        """Отметить лотерею как рассчитываемую"""
+        session = async_db_manager.get_session()
+        try:
+            values = {'status': 'CALCULATING'}
+            if vrf_request_id:
+                values['vrf_request_id'] = vrf_request_id
+            result = await session.execute(update(Raffle).where(Raffle.raffle_id == raffle_id).values(**values))
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Raffle {raffle_id} marked as CALCULATING")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error marking raffle calculating: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def finalize_raffle(raffle_id: int, winner_address: str, prize_amount: int):
+        """Завершить лотерею с победителем"""
+        session = async_db_manager.get_session()
+        try:
+            result = await session.execute(
+                update(Raffle).where(Raffle.raffle_id == raffle_id).values(
+                    status='CLOSED',
+                    winner_address=winner_address,
+                    prize_amount=prize_amount,
+                    ended_at=datetime.utcnow()
+                )
+            )
+            if result.rowcount:
+                # Обновляем статистику пользователя
+                await session.execute(
+                    update(User).where(User.evm_address == winner_address).values(
+                        total_winnings=User.total_winnings + prize_amount,
+                        is_in_current_raffle=False
+                    )
+                )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Raffle {raffle_id} finalized. Winner: {winner_address}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error finalizing raffle: {e}")
+            raise
+        finally:
+            await session.close()
+
+
+class AsyncTransactionService:
+    """
+    Async-версия TransactionService. Запись пачек событий и откат реорганизаций
+    выполняются той же логикой, что и в sync-сервисе, через AsyncSession.run_sync
+    """
+    @staticmethod
+    async def create_transaction(tg_id: str, tx_hash: str, tx_type: str, from_addr: str, to_addr: str, amount: int = 0) -> Transaction:
+        """Создать запись о транзакции"""
+        session = async_db_manager.get_session()
+        try:
+            tx = Transaction(
+                tg_id=str(tg_id),
+                tx_hash=tx_hash,
+                tx_type=tx_type,
+                from_address=from_addr,
+                to_address=to_addr,
+                amount=amount,
+                status='PENDING'
+            )
+            session.add(tx)
+            await session.commit()
+            logger.info(f"Created transaction record: {tx_hash}")
+            return tx
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error creating transaction: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def mark_transaction_confirmed(tx_hash: str, gas_used: int = None, block_number: int = None):
+        """Отметить транзакцию как подтвержденную"""
+        session = async_db_manager.get_session()
+        try:
+            result = await session.execute(
+                update(Transaction).where(Transaction.tx_hash == tx_hash).values(
+                    status='CONFIRMED',
+                    gas_used=gas_used,
+                    block_number=block_number,
+                    confirmed_at=func.now()
+                )
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"Transaction confirmed: {tx_hash}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error confirming transaction: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def get_unmined_hashes() -> list:
+        """Хеши отправленных нами транзакций, для которых еще нет receipt"""
+        session = async_db_manager.get_session()
+        try:
+            rows = await session.scalars(select(Transaction.tx_hash).where(
+                Transaction.status == 'PENDING',
+                Transaction.block_number.is_(None),
+                Transaction.log_index.is_(None)
+            ))
+            jobs = await session.scalars(select(EntryJob.tx_hash).where(
+                EntryJob.status == 'PENDING',
+                EntryJob.tx_hash.isnot(None)
+            ))
+            return list(set(rows) | set(jobs))
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def write_event_batch(batch: EventBatch, cursor: tuple = None, confirm_up_to: int = None) -> int:
+        """
+        Записать все изменения одного опроса одной транзакцией
+        (см. TransactionService.write_event_batch)
+
+        Returns:
+            Количество новых записей transactions
+        """
+        session = async_db_manager.get_session()
+        try:
+            inserted, promoted = await session.run_sync(
+                TransactionService._write_event_batch, batch, cursor, confirm_up_to
+            )
+            await session.commit()
+            if batch or promoted:
+                logger.info(
+                    f"Event batch written: {inserted}/{len(batch.transactions)} new transactions, "
+                    f"{len(batch.confirmations)} mined, {promoted} confirmed"
+                )
+            return inserted
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error writing event batch: {e}")
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def rollback_after(block_number: int, cursor: tuple = None):
+        """Откатить неподтвержденные записи из блоков > block_number (см. TransactionService.rollback_after)"""
+        session = async_db_manager.get_session()
+        try:
+            deleted, reset, confirmed = await session.run_sync(
+                TransactionService._rollback_after, block_number, cursor
+            )
+            await session.commit()
+            logger.warning(
+                f"Rolled back to block {block_number}: {deleted} event records removed, {reset} entries reset"
+            )
+            if confirmed:
+                logger.critical(
+                    f"Reorg deeper than CONFIRMATION_DEPTH: {confirmed} CONFIRMED transactions above block {block_number}"
+                )
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error rolling back transactions: {e}")
+            raise
+        finally:
+            await session.close()
+
+
+class AsyncBlockHashService:
+    @staticmethod
+    async def get_block_hash(block_number: int):
+        """Сохраненный хеш блока или None"""
+        session = async_db_manager.get_session()
+        try:
+            return await session.scalar(select(BlockHash.block_hash).where(BlockHash.block_number == block_number))
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def get_hashes_before(block_number: int) -> list:
+        """(block_number, block_hash) сохраненных блоков < block_number, от новых к старым"""
+        session = async_db_manager.get_session()
+        try:
+            result = await session.execute(
+                select(BlockHash.block_number, BlockHash.block_hash).where(
+                    BlockHash.block_number < block_number
+                ).order_by(BlockHash.block_number.desc())
+            )
+            return result.all()
+        finally:
+            await session.close()
+
+
+class AsyncCursorService:
+    @staticmethod
+    async def get_last_block(listener: str, contract_address: str):
+        """Получить последний обработанный блок для слушателя и контракта"""
+        session = async_db_manager.get_session()
+        try:
+            return await session.scalar(select(BlockCursor.last_block).where(
+                BlockCursor.listener == listener,
+                BlockCursor.contract_address == contract_address
+            ))
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def save_last_block(listener: str, contract_address: str, block_number: int):
+        """Сохранить последний обработанный блок"""
+        session = async_db_manager.get_session()
+        try:
+            await session.run_sync(CursorService._save, listener, contract_address, block_number)
+            await session.commit()
+            logger.debug(f"Cursor {listener}@{contract_address} saved at block {block_number}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error saving block cursor: {e}")
+            raise
+        finally:
+            await session.close()
@@ -1,23 +1,83 @@
 import logging
-from database.models import db_manager, User, Raffle, Transaction
-from sqlalchemy import func
+from datetime import datetime, timedelta
+import uuid
+from database.models import (
+    db_manager, User, Raffle, Transaction, BlockCursor, BlockHash, EntryJob, WalletPoolEntry,
+    KeyRotationProgress
+)
+from database.address_index import address_index
+from sqlalchemy import func, update, delete, select, bindparam
+from config.settings import config
 
 logger = logging.getLogger(__name__)
 
+UPSERT_CHUNK_SIZE = 500
+
+
+def upsert_insert(session, model):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей сессии"""
+    if session.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+class EventBatch:
+    """
+    Изменения БД, собранные обработчиками из логов одного опроса.
+    Пишутся одной транзакцией через TransactionService.write_event_batch.
+    """
+    def __init__(self):
+        self.transactions = []   # новые записи transactions, уникальны по (tx_hash, log_index)
+        self.confirmations = []  # (tx_hash, block_number, block_hash) уже существующих транзакций
+        self.block_hashes = {}   # block_number -> block_hash обработанных блоков
+    
+    def add_transaction(self, tg_id: str, tx_hash: str, log_index: int, tx_type: str,
+                        from_addr: str, to_addr: str, amount: int = 0,
+                        block_number: int = None, block_hash: str = None):
+        self.transactions.append({
+            'tg_id': str(tg_id),
+            'tx_hash': tx_hash,
+            'log_index': log_index,
+            'tx_type': tx_type,
+            'from_address': from_addr,
+            'to_address': to_addr,
+            'amount': amount,
+            'status': 'PENDING',  # CONFIRMED - после достижения CONFIRMATION_DEPTH
+            'block_number': block_number,
+            'block_hash': block_hash
+        })
+    
+    def confirm(self, tx_hash: str, block_number: int = None, block_hash: str = None):
+        self.confirmations.append((tx_hash, block_number, block_hash))
+    
+    def record_block(self, block_number: int, block_hash: str):
+        """Запомнить хеш блока; разные хеши одного блока в одном опросе - признак реорганизации"""
+        known = self.block_hashes.get(block_number)
+        if known is not None and known != block_hash:
+            raise ValueError(f"Block {block_number} hash changed during poll: {known} != {block_hash}")
+        self.block_hashes[block_number] = block_hash
+    
+    def __len__(self):
+        return len(self.transactions) + len(self.confirmations)
+
 
 class UserService:
     @staticmethod
-    def create_user(tg_id: str, evm_address: str, encrypted_key: str) -> User:
-        """Создать нового пользователя"""
+    def create_user(tg_id: str, evm_address: str, encrypted_key: str = None, hd_index: int = None) -> User:
+        """Создать нового пользователя (с зашифрованным ключом или индексом HD-кошелька)"""
         session = db_manager.get_session()
         try:
             user = User(
                 tg_id=tg_id,
                 evm_address=evm_address,
-                encrypted_private_key=encrypted_key
+                encrypted_private_key=encrypted_key,
+                hd_index=hd_index
             )
             session.add(user)
             session.commit()
+            address_index.add(evm_address, tg_id)
             logger.info(f"Created user: {tg_id}")
             return user
         except Exception as e:
@@ -37,6 +97,26 @@ class UserService:
         finally:
             session.close()
     
+    @staticmethod
+    def get_max_hd_index() -> int:
+        """Наибольший выданный индекс HD-кошелька (-1, если их нет)"""
+        session = db_manager.get_session()
+        try:
+            max_index = session.query(func.max(User.hd_index)).scalar()
+            return max_index if max_index is not None else -1
+        finally:
+            session.close()
+    
+    @staticmethod
+    def get_users_by_tg_ids(tg_ids: list) -> dict:
+        """Пользователи по списку Telegram ID одним запросом: tg_id -> User"""
+        session = db_manager.get_session()
+        try:
+            users = session.query(User).filter(User.tg_id.in_([str(tg_id) for tg_id in tg_ids])).all()
+            return {user.tg_id: user for user in users}
+        finally:
+            session.close()
+    
     @staticmethod
     def get_user_by_address(evm_address: str) -> User:
         """Получить пользователя по EVM адресу"""
@@ -222,6 +302,536 @@ class TransactionService:
         finally:
             session.close()
 
+    
+    @staticmethod
+    def get_unmined_hashes() -> list:
+        """Хеши отправленных нами транзакций, для которых еще нет receipt"""
+        session = db_manager.get_session()
+        try:
+            rows = session.query(Transaction.tx_hash).filter(
+                Transaction.status == 'PENDING',
+                Transaction.block_number.is_(None),
+                Transaction.log_index.is_(None)
+            ).all()
+            jobs = session.query(EntryJob.tx_hash).filter(
+                EntryJob.status == 'PENDING',
+                EntryJob.tx_hash.isnot(None)
+            ).all()
+            return list({tx_hash for tx_hash, in rows + jobs})
+        finally:
+            session.close()
+    
+    @staticmethod
+    def expire_unmined(max_age: float) -> int:
+        """
+        Пометить FAILED отправленные транзакции и задачи входа, которые дольше
+        max_age секунд остаются без receipt (выброшены из mempool или заменены),
+        чтобы трекер receipt перестал их опрашивать
+        
+        Returns:
+            Количество помеченных задач и транзакций
+        """
+        session = db_manager.get_session()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+            dropped = session.query(Transaction).filter(
+                Transaction.status == 'PENDING',
+                Transaction.block_number.is_(None),
+                Transaction.log_index.is_(None),
+                Transaction.created_at < cutoff
+            ).update({Transaction.status: 'FAILED'}, synchronize_session=False)
+            dropped += session.query(EntryJob).filter(
+                EntryJob.status == 'PENDING',
+                EntryJob.tx_hash.isnot(None),
+                EntryJob.created_at < cutoff
+            ).update({
+                EntryJob.status: 'FAILED',
+                EntryJob.error: f'No receipt after {max_age:.0f}s, transaction dropped'
+            }, synchronize_session=False)
+            session.commit()
+            if dropped:
+                logger.warning(f"Marked {dropped} unmined transactions/jobs older than {max_age:.0f}s as FAILED")
+            return dropped
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error expiring unmined transactions: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def apply_receipts(receipts: dict):
+        """
+        Записать receipt транзакций одной транзакцией БД
+        
+        Успешные транзакции получают блок и gas_used (CONFIRMED - после CONFIRMATION_DEPTH),
+        ревертнувшиеся помечаются FAILED. Задачи входа в лотерею переходят в MINED/FAILED.
+        
+        Args:
+            receipts: tx_hash -> {'status', 'blockNumber', 'blockHash', 'gasUsed', ...}
+        """
+        session = db_manager.get_session()
+        try:
+            for tx_hash, receipt in receipts.items():
+                mined = receipt['status'] == 1
+                
+                values = {
+                    Transaction.block_number: receipt['blockNumber'],
+                    Transaction.block_hash: receipt['blockHash'],
+                    Transaction.gas_used: receipt['gasUsed']
+                }
+                if not mined:
+                    values[Transaction.status] = 'FAILED'
+                session.query(Transaction).filter(
+                    Transaction.tx_hash == tx_hash,
+                    Transaction.log_index.is_(None),
+                    Transaction.status == 'PENDING'
+                ).update(values, synchronize_session=False)
+                
+                jobs = session.query(EntryJob).filter(
+                    EntryJob.tx_hash == tx_hash,
+                    EntryJob.status == 'PENDING'
+                ).all()
+                for job in jobs:
+                    job.status = 'MINED' if mined else 'FAILED'
+                    job.block_number = receipt['blockNumber']
+                    job.error = None if mined else 'Transaction reverted'
+                    if mined:
+                        session.query(User).filter(User.tg_id == job.tg_id).update({
+                            User.is_in_current_raffle: True,
+                            User.total_entries: User.total_entries + 1
+                        }, synchronize_session=False)
+            
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error applying receipts: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def write_event_batch(batch: EventBatch, cursor: tuple = None, confirm_up_to: int = None) -> int:
+        """
+        Записать все изменения одного опроса одной транзакцией
+        
+        Записи вставляются через INSERT ... ON CONFLICT (tx_hash, log_index) DO NOTHING,
+        поэтому повторная доставка тех же логов ничего не меняет. Новые записи остаются
+        PENDING; в той же транзакции записи с block_number <= confirm_up_to
+        переводятся в CONFIRMED (см. promote_confirmed).
+        
+        Args:
+            batch: EventBatch с записями из логов
+            cursor: (listener, contract_address, last_block) - курсор сохраняется в той же транзакции
+            confirm_up_to: Последний блок, достигший CONFIRMATION_DEPTH
+        
+        Returns:
+            Количество новых записей transactions
+        """
+        session = db_manager.get_session()
+        try:
+            inserted, promoted = TransactionService._write_event_batch(session, batch, cursor, confirm_up_to)
+            session.commit()
+            if batch or promoted:
+                logger.info(
+                    f"Event batch written: {inserted}/{len(batch.transactions)} new transactions, "
+                    f"{len(batch.confirmations)} mined, {promoted} confirmed"
+                )
+            return inserted
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error writing event batch: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _write_event_batch(session, batch: EventBatch, cursor: tuple = None, confirm_up_to: int = None) -> tuple:
+        """
+        Изменения write_event_batch в переданной сессии, без commit
+        (общая часть для TransactionService и AsyncTransactionService)
+        
+        Returns:
+            (новых записей transactions, переведено в CONFIRMED)
+        """
+        inserted = 0
+        for i in range(0, len(batch.transactions), UPSERT_CHUNK_SIZE):
+            rows = batch.transactions[i:i + UPSERT_CHUNK_SIZE]
+            stmt = upsert_insert(session, Transaction).values(rows).on_conflict_do_nothing(
+                index_elements=['tx_hash', 'log_index']
+            ).returning(Transaction.id)
+            inserted += len(session.execute(stmt).all())
+        
+        if batch.confirmations:
+            # Транзакция замайнена, но подтверждается только на глубине CONFIRMATION_DEPTH
+            table = Transaction.__table__
+            session.execute(
+                update(table).where(
+                    table.c.tx_hash == bindparam('b_tx_hash'),
+                    table.c.status == 'PENDING'
+                ).values(
+                    block_number=bindparam('b_block_number'),
+                    block_hash=bindparam('b_block_hash')
+                ),
+                [{'b_tx_hash': tx_hash, 'b_block_number': block_number, 'b_block_hash': block_hash}
+                 for tx_hash, block_number, block_hash in batch.confirmations]
+            )
+        
+        if batch.block_hashes:
+            BlockHashService._save(session, batch.block_hashes)
+        
+        if cursor:
+            CursorService._save(session, *cursor)
+        
+        promoted = 0
+        if confirm_up_to is not None:
+            promoted = TransactionService._promote(session, confirm_up_to)
+        return inserted, promoted
+    
+    @staticmethod
+    def _promote(session, confirm_up_to: int) -> int:
+        """
+        Перевести в CONFIRMED замайненные PENDING записи с block_number <= confirm_up_to
+        и применить их эффекты к пользователям (выигрыш, депозит)
+        """
+        rows = session.query(Transaction).filter(
+            Transaction.status == 'PENDING',
+            Transaction.block_number.isnot(None),
+            Transaction.block_number <= confirm_up_to
+        ).order_by(Transaction.block_number, Transaction.log_index).all()
+        
+        now = datetime.utcnow()
+        for tx in rows:
+            if tx.tx_type == 'WIN_PRIZE':
+                session.query(User).filter(User.evm_address == tx.to_address).update({
+                    User.total_winnings: User.total_winnings + tx.amount,
+                    User.is_in_current_raffle: False
+                }, synchronize_session=False)
+            elif tx.tx_type == 'DEPOSIT':
+                session.query(User).filter(User.tg_id == tx.tg_id).update({
+                    User.deposit_amount: tx.amount,
+                    User.deposit_tx_hash: tx.tx_hash
+                }, synchronize_session=False)
+            tx.status = 'CONFIRMED'
+            tx.confirmed_at = now
+        return len(rows)
+    
+    @staticmethod
+    def rollback_after(block_number: int, cursor: tuple = None):
+        """
+        Откатить неподтвержденные записи из блоков > block_number (реорганизация цепочки)
+        
+        Записи из событий удаляются, у отправленных нами транзакций сбрасывается блок,
+        курсор (listener, contract_address) переносится на block_number.
+        """
+        session = db_manager.get_session()
+        try:
+            deleted, reset, confirmed = TransactionService._rollback_after(session, block_number, cursor)
+            session.commit()
+            logger.warning(
+                f"Rolled back to block {block_number}: {deleted} event records removed, {reset} entries reset"
+            )
+            if confirmed:
+                logger.critical(
+                    f"Reorg deeper than CONFIRMATION_DEPTH: {confirmed} CONFIRMED transactions above block {block_number}"
+                )
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error rolling back transactions: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _rollback_after(session, block_number: int, cursor: tuple = None) -> tuple:
+        """
+        Изменения rollback_after в переданной сессии, без commit
+        
+        Returns:
+            (удалено записей событий, сброшено записей, CONFIRMED выше block_number)
+        """
+        above = Transaction.block_number > block_number
+        deleted = session.query(Transaction).filter(
+            above, Transaction.status == 'PENDING', Transaction.log_index.isnot(None)
+        ).delete(synchronize_session=False)
+        reset = session.query(Transaction).filter(
+            above, Transaction.status == 'PENDING', Transaction.log_index.is_(None)
+        ).update({
+            Transaction.block_number: None,
+            Transaction.block_hash: None
+        }, synchronize_session=False)
+        confirmed = session.query(Transaction).filter(
+            above, Transaction.status == 'CONFIRMED'
+        ).count()
+        
+        session.query(BlockHash).filter(BlockHash.block_number > block_number).delete(
+            synchronize_session=False
+        )
+        if cursor:
+            CursorService._save(session, *cursor, block_number)
+        return deleted, reset, confirmed
+
+
+class EntryJobService:
+    @staticmethod
+    def create_job(tg_id: str, tx_hash: str) -> EntryJob:
+        """Создать задачу асинхронного входа в лотерею"""
+        session = db_manager.get_session()
+        try:
+            job = EntryJob(job_id=uuid.uuid4().hex, tg_id=str(tg_id), tx_hash=tx_hash, status='PENDING')
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            logger.info(f"Created entry job {job.job_id} for {tg_id}")
+            return job
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error creating entry job: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def get_job(job_id: str) -> EntryJob:
+        """Получить задачу по job_id"""
+        session = db_manager.get_session()
+        try:
+            return session.query(EntryJob).filter(EntryJob.job_id == job_id).first()
+        finally:
+            session.close()
+    
+    @staticmethod
+    def update_job_status(job_id: str, status: str, block_number: int = None, error: str = None) -> EntryJob:
+        """Обновить статус задачи (MINED / FAILED)"""
+        session = db_manager.get_session()
+        try:
+            job = session.query(EntryJob).filter(EntryJob.job_id == job_id).first()
+            if job:
+                job.status = status
+                job.block_number = block_number
+                job.error = error
+                session.commit()
+                session.refresh(job)
+                logger.info(f"Entry job {job_id} -> {status}")
+            return job
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error updating entry job: {e}")
+            raise
+        finally:
+            session.close()
+
+
+class BlockHashService:
+    @staticmethod
+    def _save(session, block_hashes: dict):
+        stmt = upsert_insert(session, BlockHash).values([
+            {'block_number': number, 'block_hash': block_hash}
+            for number, block_hash in block_hashes.items()
+        ])
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=['block_number'],
+            set_={'block_hash': stmt.excluded.block_hash}
+        ))
+        # Старые хеши для поиска общего предка уже не нужны
+        session.query(BlockHash).filter(
+            BlockHash.block_number < max(block_hashes) - config.REORG_HISTORY_BLOCKS
+        ).delete(synchronize_session=False)
+    
+    @staticmethod
+    def get_block_hash(block_number: int):
+        """Сохраненный хеш блока или None"""
+        session = db_manager.get_session()
+        try:
+            row = session.query(BlockHash).filter(BlockHash.block_number == block_number).first()
+            return row.block_hash if row else None
+        finally:
+            session.close()
+    
+    @staticmethod
+    def get_hashes_before(block_number: int) -> list:
+        """(block_number, block_hash) сохраненных блоков < block_number, от новых к старым"""
+        session = db_manager.get_session()
+        try:
+            return session.query(BlockHash.block_number, BlockHash.block_hash).filter(
+                BlockHash.block_number < block_number
+            ).order_by(BlockHash.block_number.desc()).all()
+        finally:
+            session.close()
+
+
+class CursorService:
+    @staticmethod
+    def _save(session, listener: str, contract_address: str, block_number: int):
+        cursor = session.query(BlockCursor).filter(
+            BlockCursor.listener == listener,
+            BlockCursor.contract_address == contract_address
+        ).first()
+        if cursor:
+            cursor.last_block = block_number
+        else:
+            session.add(BlockCursor(
+                listener=listener,
+                contract_address=contract_address,
+                last_block=block_number
+            ))
+    
+    @staticmethod
+    def get_last_block(listener: str, contract_address: str):
+        """Получить последний обработанный блок для слушателя и контракта"""
+        session = db_manager.get_session()
+        try:
+            cursor = session.query(BlockCursor).filter(
+                BlockCursor.listener == listener,
+                BlockCursor.contract_address == contract_address
+            ).first()
+            return cursor.last_block if cursor else None
+        finally:
+            session.close()
+    
+    @staticmethod
+    def save_last_block(listener: str, contract_address: str, block_number: int):
+        """Сохранить последний обработанный блок"""
+        session = db_manager.get_session()
+        try:
+            CursorService._save(session, listener, contract_address, block_number)
+            session.commit()
+            logger.debug(f"Cursor {listener}@{contract_address} saved at block {block_number}")
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error saving block cursor: {e}")
+            raise
+        finally:
+            session.close()
+
+
+
+class WalletPoolService:
+    @staticmethod
+    def claim():
+        """
+        Атомарно забрать один заранее созданный кошелек из пула
+        
+        Строка удаляется одним DELETE ... RETURNING; в PostgreSQL кандидат
+        выбирается с FOR UPDATE SKIP LOCKED, поэтому параллельные запросы
+        не ждут друг друга.
+        
+        Returns:
+            (evm_address, encrypted_private_key) или None, если пул пуст
+        """
+        session = db_manager.get_session()
+        try:
+            candidate = select(WalletPoolEntry.id).order_by(WalletPoolEntry.id).limit(1) \
+                .with_for_update(skip_locked=True).scalar_subquery()
+            for _ in range(3):
+                row = session.execute(
+                    delete(WalletPoolEntry).where(WalletPoolEntry.id == candidate).returning(
+                        WalletPoolEntry.evm_address, WalletPoolEntry.encrypted_private_key
+                    )
+                ).first()
+                session.commit()
+                if row:
+                    return row.evm_address, row.encrypted_private_key
+                # Кандидата забрал параллельный запрос - пробуем следующий, если пул не пуст
+                if not session.query(WalletPoolEntry.id).first():
+                    return None
+            return None
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error claiming wallet from pool: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def add_wallets(wallets: list):
+        """Добавить кошельки в пул: [(evm_address, encrypted_private_key), ...]"""
+        session = db_manager.get_session()
+        try:
+            session.execute(
+                WalletPoolEntry.__table__.insert(),
+                [{'evm_address': address, 'encrypted_private_key': encrypted_key}
+                 for address, encrypted_key in wallets]
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error adding wallets to pool: {e}")
+            raise
+        finally:
+            session.close()
+    
+    @staticmethod
+    def count() -> int:
+        """Сколько кошельков в пуле"""
+        session = db_manager.get_session()
+        try:
+            return session.query(func.count(WalletPoolEntry.id)).scalar()
+        finally:
+            session.close()
+
+
+
+class KeyRotationService:
+    """Чтение и запись зашифрованных ключей частями для ротации ENCRYPTION_KEY"""
+    
+    @staticmethod
+    def get_progress(rotation_id: str, table_name: str) -> tuple:
+        """(last_id, rotated) сохраненного прогресса или (0, 0)"""
+        session = db_manager.get_session()
+        try:
+            progress = session.query(KeyRotationProgress).filter(
+                KeyRotationProgress.rotation_id == rotation_id,
+                KeyRotationProgress.table_name == table_name
+            ).first()
+            return (progress.last_id, progress.rotated) if progress else (0, 0)
+        finally:
+            session.close()
+    
+    @staticmethod
+    def fetch_chunk(model, after_id: int, limit: int) -> list:
+        """Следующие limit строк с ключом после after_id (keyset-пагинация): [(id, encrypted_private_key)]"""
+        session = db_manager.get_session()
+        try:
+            return session.query(model.id, model.encrypted_private_key).filter(
+                model.id > after_id,
+                model.encrypted_private_key.isnot(None)
+            ).order_by(model.id).limit(limit).all()
+        finally:
+            session.close()
+    
+    @staticmethod
+    def save_chunk(model, rotation_id: str, rows: list, last_id: int):
+        """Записать перешифрованные ключи и прогресс одной транзакцией: rows = [(id, новый ключ)]"""
+        table = model.__table__
+        session = db_manager.get_session()
+        try:
+            if rows:
+                session.execute(
+                    update(table).where(table.c.id == bindparam('b_id')).values(
+                        encrypted_private_key=bindparam('b_key')
+                    ),
+                    [{'b_id': row_id, 'b_key': encrypted_key} for row_id, encrypted_key in rows]
+                )
+            
+            progress = session.query(KeyRotationProgress).filter(
+                KeyRotationProgress.rotation_id == rotation_id,
+                KeyRotationProgress.table_name == table.name
+            ).first()
+            if progress is None:
+                progress = KeyRotationProgress(rotation_id=rotation_id, table_name=table.name, rotated=0)
+                session.add(progress)
+            progress.last_id = last_id
+            progress.rotated = (progress.rotated or 0) + len(rows)
+            
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error saving rotated keys: {e}")
+            raise
+        finally:
+            session.close()
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
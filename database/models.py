@@ -1,5 +1,12 @@
 import logging
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Boolean, Text
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import (
+    create_engine, event, inspect, text, Column, String, Integer, DateTime, Boolean, Text, Index, MetaData,
+    UniqueConstraint
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -16,7 +23,8 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     tg_id = Column(String(255), unique=True, nullable=False, index=True)
     evm_address = Column(String(255), unique=True, nullable=False, index=True)
-    encrypted_private_key = Column(Text, nullable=False)
+    encrypted_private_key = Column(Text, nullable=True)  # NULL для HD-кошельков
+    hd_index = Column(Integer, unique=True, nullable=True)  # индекс в пути вывода (WALLET_MODE=hd)
     
     is_in_current_raffle = Column(Boolean, default=False)
     deposit_amount = Column(Integer, default=0)  # в wei
@@ -25,7 +33,7 @@ class User(Base):
     total_entries = Column(Integer, default=0)
     total_winnings = Column(Integer, default=0)  # в wei
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
@@ -56,10 +64,21 @@ class Raffle(Base):
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Одна запись на лог; для отправленных нами транзакций log_index = NULL
+        UniqueConstraint('tx_hash', 'log_index', name='uq_transaction_tx_hash_log_index'),
+        # NULL не конфликтуют в уникальном ключе выше: отправленная транзакция - одна запись на tx_hash
+        Index(
+            'uq_transaction_sent_tx_hash', 'tx_hash', unique=True,
+            sqlite_where=text('log_index IS NULL'),
+            postgresql_where=text('log_index IS NULL')
+        ),
+    )
     
     id = Column(Integer, primary_key=True)
     tg_id = Column(String(255), nullable=False, index=True)
-    tx_hash = Column(String(255), unique=True, nullable=False, index=True)
+    tx_hash = Column(String(255), nullable=False, index=True)
+    log_index = Column(Integer, nullable=True)  # индекс лога, если запись создана из события
     tx_type = Column(String(50), nullable=False)  # 'DEPOSIT', 'ENTER_RAFFLE', 'WIN_PRIZE'
     
     from_address = Column(String(255), nullable=False)
@@ -69,6 +88,7 @@ class Transaction(Base):
     status = Column(String(50), default='PENDING')  # PENDING, CONFIRMED, FAILED
     gas_used = Column(Integer, nullable=True)
     block_number = Column(Integer, nullable=True)
+    block_hash = Column(String(66), nullable=True)  # для отката при реорганизации
     
     created_at = Column(DateTime, default=datetime.utcnow)
     confirmed_at = Column(DateTime, nullable=True)
@@ -77,11 +97,130 @@ class Transaction(Base):
         return f"<Transaction {self.tx_type} {self.tx_hash[:10]}... status={self.status}>"
 
 
+class EntryJob(Base):
+    __tablename__ = 'entry_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String(36), unique=True, nullable=False, index=True)
+    tg_id = Column(String(255), nullable=False, index=True)
+    tx_hash = Column(String(255), nullable=True, index=True)  # deposit транзакция
+    
+    status = Column(String(50), default='PENDING')  # PENDING, MINED, FAILED
+    block_number = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'tg_id': self.tg_id,
+            'status': self.status,
+            'tx_hash': self.tx_hash,
+            'block_number': self.block_number,
+            'error': self.error
+        }
+    
+    def __repr__(self):
+        return f"<EntryJob {self.job_id} tg_id={self.tg_id} status={self.status}>"
+
+
+class BlockCursor(Base):
+    __tablename__ = 'block_cursors'
+    __table_args__ = (
+        UniqueConstraint('listener', 'contract_address', name='uq_block_cursor_listener_contract'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    listener = Column(String(100), nullable=False)  # имя LogIngestor: 'ingestor', 'backfill'
+    contract_address = Column(String(255), nullable=False)
+    last_block = Column(Integer, nullable=False)  # последний полностью обработанный блок
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<BlockCursor {self.listener} {self.contract_address[:10]}... block={self.last_block}>"
+
+
+class BlockHash(Base):
+    __tablename__ = 'block_hashes'
+    
+    block_number = Column(Integer, primary_key=True, autoincrement=False)
+    block_hash = Column(String(66), nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<BlockHash {self.block_number} {self.block_hash[:10]}...>"
+
+
+class WalletPoolEntry(Base):
+    __tablename__ = 'wallet_pool'
+    
+    id = Column(Integer, primary_key=True)
+    evm_address = Column(String(255), unique=True, nullable=False)
+    encrypted_private_key = Column(Text, nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<WalletPoolEntry {self.evm_address[:10]}...>"
+
+
+class KeyRotationProgress(Base):
+    __tablename__ = 'key_rotation_progress'
+    __table_args__ = (
+        UniqueConstraint('rotation_id', 'table_name', name='uq_key_rotation_table'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    rotation_id = Column(String(64), nullable=False)  # отпечаток нового ENCRYPTION_KEY
+    table_name = Column(String(100), nullable=False)
+    last_id = Column(Integer, nullable=False, default=0)  # последний перешифрованный id
+    rotated = Column(Integer, nullable=False, default=0)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<KeyRotationProgress {self.rotation_id} {self.table_name} last_id={self.last_id}>"
+
+
+def engine_options(url) -> dict:
+    """Параметры create_engine для бэкенда БД"""
+    if url.get_backend_name() == 'postgresql':
+        return {
+            'pool_size': config.DB_POOL_SIZE,
+            'max_overflow': config.DB_MAX_OVERFLOW,
+            'pool_recycle': config.DB_POOL_RECYCLE,
+            'pool_pre_ping': True
+        }
+    if url.get_backend_name() == 'sqlite':
+        # Соединения используются из фоновых потоков и пула bulk-входа
+        return {'connect_args': {'check_same_thread': False}}
+    return {}
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """WAL: читатели не блокируют писателя; NORMAL достаточно для WAL без потери целостности"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
 class DatabaseManager:
     def __init__(self):
-        self.engine = create_engine(config.DATABASE_URL, echo=False)
+        url = make_url(config.DATABASE_URL)
+        self.engine = create_engine(url, echo=False, **engine_options(url))
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            event.listen(self.engine, 'connect', _configure_sqlite)
         self.Session = sessionmaker(bind=self.engine)
-        logger.info(f"Database initialized: {config.DATABASE_URL}")
+        # Соединение активного session_scope() в текущем потоке/задаче
+        self._scope_connection = ContextVar('db_scope_connection', default=None)
+        logger.info(f"Database initialized: {url.render_as_string(hide_password=True)}")
     
     def create_all_tables(self):
         try:
@@ -91,9 +230,138 @@ class DatabaseManager:
             logger.error(f"Error creating tables: {e}")
             raise
     
+    def upgrade_schema(self):
+        """
+        Довести схему существующей БД до моделей: create_all создает только новые
+        таблицы, поэтому недостающие колонки, уникальные ключи и индексы добавляются
+        здесь, а индексы с другой уникальностью (transactions.tx_hash) пересоздаются
+        """
+        with self.engine.begin() as connection:
+            inspector = inspect(connection)
+            tables = set(inspector.get_table_names())
+            for table in Base.metadata.sorted_tables:
+                if table.name in tables:
+                    self._upgrade_table(connection, inspector, table)
+        logger.info("Database schema is up to date")
+    
+    @staticmethod
+    def _upgrade_table(connection, inspector, table):
+        columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        indexes = {index['name']: index for index in inspector.get_indexes(table.name)}
+        # Уникальные ключи БД по наборам колонок (частичные индексы не считаются)
+        unique_keys = {
+            tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(table.name)
+        } | {
+            tuple(index['column_names']) for index in indexes.values()
+            if index['unique'] and not any(key.endswith('_where') for key in index.get('dialect_options', {}))
+        }
+        
+        rebuild = False
+        for column in table.columns:
+            current = columns.get(column.name)
+            if current is None:
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                logger.info(f"Added column {table.name}.{column.name}")
+            elif column.nullable and not current['nullable']:
+                if connection.dialect.name == 'postgresql':
+                    connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"))
+                    logger.info(f"Dropped NOT NULL on {table.name}.{column.name}")
+                else:
+                    rebuild = True
+        
+        if rebuild:
+            # Пересозданная таблица уже содержит все ключи и индексы модели
+            DatabaseManager._rebuild_table(connection, table, columns)
+            return
+        
+        # SQLite не добавляет ограничения через ALTER TABLE: уникальный ключ создается индексом
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint):
+                column_names = tuple(column.name for column in constraint.columns)
+                if column_names not in unique_keys:
+                    name = constraint.name or f"uq_{table.name}_{'_'.join(column_names)}"
+                    connection.execute(text(
+                        f"CREATE UNIQUE INDEX {name} ON {table.name} ({', '.join(column_names)})"
+                    ))
+                    logger.info(f"Created unique index {name}")
+        
+        for index in table.indexes:
+            current = indexes.get(index.name)
+            if current is not None and bool(current['unique']) != bool(index.unique):
+                index.drop(connection)
+                current = None
+            if current is None:
+                index.create(connection)
+                logger.info(f"Created index {index.name}")
+    
+    @staticmethod
+    def _rebuild_table(connection, table, columns):
+        """
+        SQLite не снимает NOT NULL через ALTER TABLE: таблица создается заново по модели
+        под временным именем, общие колонки копируются, старая таблица удаляется,
+        новая переименовывается и получает индексы модели
+        """
+        rebuilt = table.to_metadata(MetaData(), name=f"{table.name}_rebuild")
+        connection.execute(text(f"DROP TABLE IF EXISTS {rebuilt.name}"))
+        connection.execute(CreateTable(rebuilt))
+        common = ', '.join(column.name for column in table.columns if column.name in columns)
+        connection.execute(text(f"INSERT INTO {rebuilt.name} ({common}) SELECT {common} FROM {table.name}"))
+        connection.execute(text(f"DROP TABLE {table.name}"))
+        connection.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+        for index in table.indexes:
+            index.create(connection)
+        logger.info(f"Rebuilt table {table.name} to match the model")
+    
     def get_session(self):
+        """
+        Новая сессия. Внутри session_scope() она работает в общей транзакции
+        блока: commit() сервиса только сбрасывает изменения (flush), а rollback()
+        откатывает всю транзакцию блока
+        """
+        connection = self._scope_connection.get()
+        if connection is not None:
+            return self.Session(bind=connection, join_transaction_mode='rollback_only')
         return self.Session()
     
+    @contextmanager
+    def session_scope(self):
+        """
+        Unit of work: все вызовы сервисов внутри блока используют одно соединение
+        и фиксируются одним COMMIT при выходе (ROLLBACK при исключении).
+        Вложенный session_scope() присоединяется к внешнему.
+        
+        with db_manager.session_scope() as session:
+            TransactionService.create_transaction(...)
+            EntryJobService.create_job(...)
+        """
+        if self._scope_connection.get() is not None:
+            session = self.get_session()
+            try:
+                yield session
+                session.flush()
+            finally:
+                session.close()
+            return
+        
+        connection = self.engine.connect()
+        transaction = connection.begin()
+        token = self._scope_connection.set(connection)
+        session = self.get_session()
+        try:
+            yield session
+            session.flush()
+            if transaction.is_active:
+                transaction.commit()
+        except Exception:
+            if transaction.is_active:
+                transaction.rollback()
+            raise
+        finally:
+            session.close()
+            self._scope_connection.reset(token)
+            connection.close()
+    
     def close_session(self, session):
         if session:
             session.close()
@@ -202,10 +202,13 @@ async def example_event_listener():
     """
     print("\n=== ПРИМЕР 6: Слушание событий ===\n")
     
+    from contracts.async_raffle_service import AsyncRaffleService
     from transaction.event_listener import EventListener
-    import asyncio
+    from transaction.log_ingestor import LogIngestor
     
-    listener = EventListener()
+    contract_manager = await AsyncRaffleService.create()
+    ingestor = LogIngestor(contract_manager)
+    EventListener(contract_manager).register(ingestor)
     
     print("👂 Слушаем события WinnerPicked...")
     print("(Это будет выполняться в фоне в основном приложении)")
@@ -214,7 +217,9 @@ async def example_event_listener():
     # и слушает весь день
     try:
         # Пример: слушаем только один раз для демонстрации
-        async for notification in listener.listen_for_winner(run_once=True):
+        async for notification in ingestor.run(run_once=True):
+            if notification['type'] != 'WINNER_PICKED':
+                continue
             print(f"\n🎉 СОБЫТИЕ ПОЛУЧЕНО!")
             print(f"Тип: {notification['type']}")
             print(f"Победитель TG ID: {notification['winner_tg_id']}")
@@ -226,6 +231,8 @@ async def example_event_listener():
             # "🎉 Поздравляем! Вы выиграли X USDT!"
     except Exception as e:
         print(f"Нет новых событий или ошибка: {e}")
+    finally:
+        await contract_manager.close()
 
 
 # ============================================================================
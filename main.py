@@ -2,7 +2,11 @@ import logging
 import asyncio
 from transaction.event_listener import EventListener
 from transaction.raffle_processor import DepositListener
-from bot_api.api_handlers import app
+from transaction.log_ingestor import LogIngestor
+from transaction.backfill import Backfiller
+from transaction.event_bus import build_event_bus
+from contracts.async_raffle_service import AsyncRaffleService
+from database.async_db_service import async_db_manager
 from config.settings import config
 
 logging.basicConfig(
@@ -15,38 +19,95 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def consume_generator(gen, name="Listener"):
+async def consume_generator(gen, name="Listener", bus=None):
     """Вспомогательная функция для запуска генератора в фоне"""
     try:
         async for event in gen:
             logger.info(f"[{name}] Received event: {event}")
-            # Тут можно добавить логику обработки события, если она нужна на уровне main
-            # Например, отправку в очередь сообщений или вебхук
+            # Отправка боту идет через шину и не задерживает чтение логов
+            if bus:
+                bus.publish(event)
     except Exception as e:
         logger.error(f"[{name}] Error: {e}")
 
+async def build_ingestor(name: str = 'ingestor') -> LogIngestor:
+    """LogIngestor со всеми обработчиками событий"""
+    # Один AsyncRaffleService и один цикл eth_getLogs для всех слушателей
+    contract_manager = await AsyncRaffleService.create()
+    ingestor = LogIngestor(contract_manager, name=name)
+    
+    EventListener(contract_manager).register(ingestor)
+    DepositListener(contract_manager).register(ingestor)
+    return ingestor
+
 async def run_listeners():
     """Запустить все слушатели событий"""
     logger.info("Starting event listeners...")
     
-    event_listener = EventListener()
-    deposit_listener = DepositListener()
-    
-    # Запускаем слушатели параллельно
-    tasks = [
-        asyncio.create_task(consume_generator(event_listener.listen_for_winner())),
-        asyncio.create_task(consume_generator(event_listener.listen_for_entries())),
-        asyncio.create_task(deposit_listener.listen_for_deposits())
-    ]
+    ingestor = await build_ingestor()
+    bus = build_event_bus()
+    await bus.start()
     
     try:
-        await asyncio.gather(*tasks)
+        await consume_generator(ingestor.run(), name="Ingestor", bus=bus)
     except Exception as e:
         logger.error(f"Error in listeners: {e}")
+    finally:
+        await bus.stop()
+        await ingestor.contract_manager.close()
+        await async_db_manager.dispose()
+
+
+async def run_backfill(argv):
+    """Переиндексировать историю: python main.py backfill [--from-block N] [--to-block M]"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="python main.py backfill")
+    parser.add_argument('--from-block', type=int, default=None)
+    parser.add_argument('--to-block', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=None)
+    args = parser.parse_args(argv)
+    
+    ingestor = await build_ingestor(name='backfill')
+    try:
+        await Backfiller(ingestor, concurrency=args.concurrency).run(
+            from_block=args.from_block,
+            to_block=args.to_block
+        )
+    finally:
+        await ingestor.contract_manager.close()
+        await async_db_manager.dispose()
+
+
+def run_key_rotation(argv):
+    """
+    Перешифровать ключи текущим ENCRYPTION_KEY:
+    python main.py rotate-keys [--chunk-size N] [--workers N] [--rotation-id ID] [--seed-output FILE]
+    """
+    import argparse
+    from wallet.key_rotation import KeyRotator
+    
+    parser = argparse.ArgumentParser(prog="python main.py rotate-keys")
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--rotation-id', default=None)
+    parser.add_argument('--seed-output', default=None)
+    args = parser.parse_args(argv)
+    
+    KeyRotator(
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        rotation_id=args.rotation_id,
+        seed_output=args.seed_output
+    ).run()
 
 
 def run_api_server():
     """Запустить API сервер"""
+    # Flask-приложение и его фоновые службы нужны только в этом режиме
+    from bot_api.api_handlers import app, start_background_services
+    
+    start_background_services()
     logger.info(f"Starting API server on {config.API_HOST}:{config.API_PORT}")
     app.run(host=config.API_HOST, port=config.API_PORT)
 
@@ -65,12 +126,19 @@ if __name__ == "__main__":
             asyncio.run(run_listeners())
         elif mode == "api":
             run_api_server()
+        elif mode == "backfill":
+            asyncio.run(run_backfill(sys.argv[2:]))
+        elif mode == "rotate-keys":
+            run_key_rotation(sys.argv[2:])
         else:
-            print("Usage: python main.py [listeners|api]")
+            print("Usage: python main.py [listeners|api|backfill|rotate-keys]")
     else:
         # Запускаем оба в разных потоках (для локального тестирования)
         import threading
+        from bot_api.api_handlers import start_background_services
         
+        # Процессы подписи форкаются до потока слушателей
+        start_background_services()
         listener_thread = threading.Thread(target=lambda: asyncio.run(run_listeners()))
         listener_thread.daemon = True
         listener_thread.start()
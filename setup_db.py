@@ -7,11 +7,12 @@ logger = logging.getLogger(__name__)
 
 def setup_database():
     """
-    Инициализирует базу данных и создает все таблицы
+    Инициализирует базу данных, создает все таблицы и обновляет схему существующих
     """
     try:
         logger.info("Initializing database...")
         db_manager.create_all_tables()
+        db_manager.upgrade_schema()
         logger.info("Database initialized successfully!")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
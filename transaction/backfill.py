@@ -0,0 +1,150 @@
+import logging
+import asyncio
+from config.settings import config
+from database.db_service import EventBatch
+from database.async_db_service import AsyncCursorService, AsyncTransactionService
+from database.address_index import address_index
+from transaction.log_ingestor import LogIngestor
+
+logger = logging.getLogger(__name__)
+
+# Фрагменты сообщений об ошибках провайдеров при слишком большом ответе eth_getLogs
+TOO_MANY_RESULTS_ERRORS = (
+    'query returned more than',
+    'too many results',
+    'log response size exceeded',
+    'response size exceeded',
+    'block range',
+    'limit exceeded',
+    'query timeout',
+)
+
+
+def is_too_many_results(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(fragment in message for fragment in TOO_MANY_RESULTS_ERRORS)
+
+
+class Backfiller:
+    """
+    Историческое переиндексирование логов через обработчики LogIngestor.
+
+    Диапазон get_logs подстраивается под плотность логов: растет, пока логов
+    меньше BACKFILL_TARGET_LOGS, и уменьшается при их избытке или при ошибке
+    провайдера "too many results" (тогда диапазон делится пополам и
+    запрашивается заново). Несколько диапазонов запрашиваются параллельно,
+    но передаются обработчикам строго по порядку блоков.
+    """
+    def __init__(self, ingestor: LogIngestor, concurrency: int = None):
+        self.ingestor = ingestor
+        self.w3 = ingestor.w3
+        self.concurrency = concurrency or config.BACKFILL_CONCURRENCY
+        self.range_size = config.BACKFILL_INITIAL_RANGE
+        self.cursor_name = 'backfill'
+
+    def _deploy_block(self) -> int:
+        """Блок деплоя контракта: из настроек или из contract_info.json"""
+        if config.RAFFLE_DEPLOY_BLOCK is not None:
+            return config.RAFFLE_DEPLOY_BLOCK
+        contract_data = self.ingestor.contract_manager.client.contract_data
+        return int(contract_data.get('deploy_block', 0))
+
+    def _adjust_range_size(self, ranges: list, results: list):
+        """Подстроить размер диапазона под наблюдаемую плотность логов"""
+        blocks = sum(to_block - from_block + 1 for from_block, to_block in ranges)
+        logs = sum(len(result) for result in results)
+        density = logs / blocks if blocks else 0
+
+        if density:
+            size = int(config.BACKFILL_TARGET_LOGS / density)
+        else:
+            size = self.range_size * 2
+
+        self.range_size = max(config.BACKFILL_MIN_RANGE, min(size, config.BACKFILL_MAX_RANGE))
+
+    async def _fetch(self, from_block: int, to_block: int) -> list:
+        """Получить логи диапазона, деля его пополам при ошибке переполнения"""
+        try:
+            return await self.ingestor.fetch_logs(from_block, to_block)
+        except Exception as e:
+            if from_block >= to_block or not is_too_many_results(e):
+                raise
+
+            middle = (from_block + to_block) // 2
+            self.range_size = max(config.BACKFILL_MIN_RANGE, (to_block - from_block + 1) // 2)
+            logger.info(f"Range {from_block} - {to_block} too large, splitting at {middle}")
+
+            left = await self._fetch(from_block, middle)
+            right = await self._fetch(middle + 1, to_block)
+            return left + right
+
+    def _dispatch(self, logs: list, batch: EventBatch) -> int:
+        """Передать логи обработчикам; ошибки отдельных логов не останавливают backfill"""
+        handled = 0
+        for log in logs:
+            try:
+                self.ingestor.dispatch(log, batch)
+                handled += 1
+            except Exception as e:
+                logger.warning(
+                    f"Skipping log {log['transactionHash'].hex()}:{log['logIndex']} during backfill: {e}"
+                )
+        return handled
+
+    async def run(self, from_block: int = None, to_block: int = None):
+        """
+        Пройти историю от from_block до to_block
+
+        Args:
+            from_block: Начальный блок (по умолчанию - сохраненный прогресс или блок деплоя)
+            to_block: Конечный блок (по умолчанию - текущий safe head)
+        """
+        cursor_address = ','.join(self.ingestor.addresses)
+
+        if from_block is None:
+            last_block = await AsyncCursorService.get_last_block(self.cursor_name, cursor_address)
+            from_block = last_block + 1 if last_block is not None else self._deploy_block()
+        head = await self.w3.eth.block_number
+        if to_block is None:
+            to_block = head - config.CONFIRMATION_BLOCKS
+
+        logger.info(f"Backfilling blocks {from_block} - {to_block} ({self.concurrency} parallel ranges)")
+
+        block = from_block
+        total_logs = 0
+        write = None
+
+        while block <= to_block:
+            ranges = []
+            while block <= to_block and len(ranges) < self.concurrency:
+                end = min(block + self.range_size - 1, to_block)
+                ranges.append((block, end))
+                block = end + 1
+
+            await asyncio.to_thread(address_index.refresh)
+            results = await asyncio.gather(*(self._fetch(start, end) for start, end in ranges))
+
+            batch = EventBatch()
+            for logs in results:
+                total_logs += self._dispatch(logs, batch)
+
+            # Пачка пишется, пока загружаются следующие диапазоны; пачки (и курсор)
+            # фиксируются строго по порядку
+            if write is not None:
+                await write
+            write = asyncio.create_task(AsyncTransactionService.write_event_batch(
+                batch,
+                cursor=(self.cursor_name, cursor_address, ranges[-1][1]),
+                confirm_up_to=head - config.CONFIRMATION_DEPTH
+            ))
+            self._adjust_range_size(ranges, results)
+
+            logger.info(
+                f"Fetched up to block {ranges[-1][1]} / {to_block}: "
+                f"{total_logs} logs, next range size {self.range_size}"
+            )
+
+        if write is not None:
+            await write
+        logger.info(f"✅ Backfill finished: {total_logs} logs processed")
+        return total_logs
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+from config.settings import config
+from database.address_index import address_index
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceLedger:
+    """
+    Балансы USDT адресов пользователей в памяти процесса API.
+
+    Балансы один раз читаются batch-запросом balanceOf на одном блоке, затем
+    фоновый поток применяет Transfer контракта USDT: один get_logs на диапазон
+    без фильтра по адресам, переводы с чужими `from` и `to` пропускаются, так что
+    число запросов не растет с числом пользователей. Новые адреса из address_index дочитываются
+    тем же batch-запросом на блоке ledger. Раз в BALANCE_RECONCILE_SECONDS все
+    балансы сверяются с цепочкой: расхождения логируются как drift и исправляются,
+    а адреса, чей balanceOf при загрузке не удался, читаются повторно.
+    При реорганизации (хеш последнего блока изменился) ledger читается заново.
+    """
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval or config.BALANCE_POLL_INTERVAL
+        self.contract_manager = None
+        self._lock = threading.Lock()
+        self._balances = {}     # 20 байт адреса -> баланс
+        self._missing = set()   # адреса, баланс которых прочитать не удалось
+        self._known = 0         # сколько адресов address_index уже загружено
+        self.block_number = None
+        self._last_block_hash = None
+        self._last_reconcile = 0.0
+        self.drift_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.block_number is not None
+
+    def start(self, contract_manager):
+        """Запустить фоновое обновление (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.contract_manager = contract_manager
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='balance-ledger', daemon=True)
+            self._thread.start()
+        logger.info("Balance ledger started")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval * 2)
+
+    def balance(self, address):
+        """Баланс адреса пользователя или None, если ledger его еще не знает"""
+        if not self.is_ready:
+            return None
+        return self._balances.get(address_index.normalize(address))
+
+    def balances(self, addresses: list):
+        """
+        Балансы нескольких адресов
+
+        Returns:
+            ({address: баланс}, block_number) или None, если хотя бы один адрес неизвестен
+        """
+        with self._lock:
+            if not self.is_ready:
+                return None
+            result = {}
+            for address in addresses:
+                balance = self._balances.get(address_index.normalize(address))
+                if balance is None:
+                    return None
+                result[address] = balance
+            return result, self.block_number
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self.is_ready:
+                    self.seed()
+                elif time.monotonic() - self._last_reconcile >= config.BALANCE_RECONCILE_SECONDS:
+                    self.reconcile()
+                else:
+                    self.poll()
+            except Exception as e:
+                logger.error(f"Error in balance ledger: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def _get_block_hash(self, block_number: int) -> str:
+        return Web3.to_hex(self.contract_manager.w3.eth.get_block(block_number)['hash'])
+
+    def _read_balances(self, addresses: list, block_number: int) -> dict:
+        """balanceOf адресов (20 байт) на блоке одним batch-запросом"""
+        checksummed = [Web3.to_checksum_address(address) for address in addresses]
+        balances, _ = self.contract_manager.get_usdt_balances(checksummed, block_number)
+        return {address: balances[checksum] for address, checksum in zip(addresses, checksummed)}
+
+    def seed(self):
+        """Прочитать балансы всех адресов пользователей на текущем блоке"""
+        block_number = self.contract_manager.w3.eth.block_number
+        address_index.refresh()
+        addresses = address_index.addresses_since(0)
+        balances = self._read_balances(addresses, block_number)
+        block_hash = self._get_block_hash(block_number)
+
+        with self._lock:
+            self._balances = {address: balance for address, balance in balances.items() if balance is not None}
+            self._missing = {address for address, balance in balances.items() if balance is None}
+            self._known = len(addresses)
+            self.block_number = block_number
+            self._last_block_hash = block_hash
+            self._last_reconcile = time.monotonic()
+        logger.info(f"Balance ledger seeded with {len(addresses)} addresses at block {block_number}")
+
+    def reconcile(self) -> int:
+        """
+        Сверить все балансы с цепочкой на блоке ledger
+
+        Returns:
+            Количество адресов с расхождением
+        """
+        self.poll()
+        with self._lock:
+            block_number = self.block_number
+            addresses = list(self._balances) + list(self._missing)
+        chain = self._read_balances(addresses, block_number)
+
+        drift = 0
+        with self._lock:
+            if self.block_number != block_number:
+                return 0  # ledger успел уйти вперед, сверка на следующем цикле
+            for address, balance in chain.items():
+                if balance is None:
+                    continue
+                if address in self._missing:
+                    # Повтор неудавшегося чтения при загрузке - это не расхождение
+                    self._missing.discard(address)
+                    self._balances[address] = balance
+                elif self._balances.get(address) != balance:
+                    drift += 1
+                    logger.warning(
+                        f"Balance drift for {Web3.to_checksum_address(address)} at block {block_number}: "
+                        f"ledger {self._balances.get(address)}, chain {balance}"
+                    )
+                    self._balances[address] = balance
+            self._last_reconcile = time.monotonic()
+
+        self.drift_count += drift
+        if drift:
+            logger.warning(f"Balance ledger reconciled with {drift} drifted addresses")
+        return drift
+
+    def _add_new_addresses(self):
+        """Дочитать балансы пользователей, появившихся в address_index"""
+        address_index.refresh()
+        new_addresses = address_index.addresses_since(self._known)
+        if not new_addresses:
+            return
+        balances = self._read_balances(new_addresses, self.block_number)
+        with self._lock:
+            for address in new_addresses:
+                if balances[address] is not None:
+                    self._balances[address] = balances[address]
+                else:
+                    self._missing.add(address)
+            self._known += len(new_addresses)
+
+    def poll(self):
+        """Применить Transfer новых блоков"""
+        w3 = self.contract_manager.w3
+
+        if self._get_block_hash(self.block_number) != self._last_block_hash:
+            logger.warning(f"Balance ledger: block {self.block_number} was reorganized, reseeding")
+            self.seed()
+            return
+
+        self._add_new_addresses()
+
+        head = w3.eth.block_number
+        if head <= self.block_number:
+            return
+        from_block = self.block_number + 1
+        to_block = min(head, self.block_number + config.MAX_BLOCK_RANGE)
+
+        transfer = self.contract_manager.usdt_contract.events.Transfer()
+        topic0 = Web3.to_hex(event_abi_to_log_topic(transfer.abi))
+        logs = w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': self.contract_manager.usdt_contract.address,
+            'topics': [topic0]
+        })
+
+        block_hash = self._get_block_hash(to_block)
+        with self._lock:
+            for log in sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex'])):
+                # from и to индексированы: topics[1] и topics[2], адрес - последние 20 байт
+                sender, recipient = bytes(log['topics'][1])[-20:], bytes(log['topics'][2])[-20:]
+                if sender not in self._balances and recipient not in self._balances:
+                    continue
+                event = transfer.process_log(log)
+                self._apply(event['args']['from'], event['args']['to'], event['args']['value'])
+            self.block_number = to_block
+            self._last_block_hash = block_hash
+
+    def _apply(self, sender: str, recipient: str, amount: int):
+        sender = address_index.normalize(sender)
+        recipient = address_index.normalize(recipient)
+        if sender in self._balances:
+            self._balances[sender] -= amount
+        if recipient in self._balances:
+            self._balances[recipient] += amount
+
+
+balance_ledger = BalanceLedger()
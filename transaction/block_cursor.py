@@ -0,0 +1,107 @@
+import logging
+from typing import Optional, Tuple
+from config.settings import config
+from database.db_service import CursorService, TransactionService, EventBatch
+from database.async_db_service import AsyncCursorService, AsyncTransactionService
+
+logger = logging.getLogger(__name__)
+
+
+class BlockCursor:
+    """
+    Персистентный курсор блоков для одного слушателя и одного контракта.
+
+    Каждый опрос забирает только диапазон (last_processed, safe_head],
+    а после обработки сохраняет его верхнюю границу в таблицу block_cursors,
+    поэтому после рестарта сканирование продолжается с того же места.
+    """
+    def __init__(self, w3, listener: str, contract_address: str):
+        self.w3 = w3
+        self.listener = listener
+        self.contract_address = contract_address
+        self.last_block = None
+        self.head = None
+        self.safe_head = None
+
+    def _initial_block(self, safe_head: int) -> int:
+        """Блок, с которого начинаем, если курсор еще не сохранялся"""
+        if config.START_BLOCK is not None:
+            return config.START_BLOCK - 1
+        return max(safe_head - config.INITIAL_LOOKBACK_BLOCKS, 0)
+
+    def next_range(self, head: int = None) -> Optional[Tuple[int, int]]:
+        """
+        Следующий диапазон блоков для get_logs
+
+        Args:
+            head: Номер последнего блока, если уже получен (например, через AsyncWeb3)
+
+        Returns:
+            (from_block, to_block) включительно или None, если новых блоков нет
+        """
+        if head is None:
+            head = self.w3.eth.block_number
+        self.head = head
+        self.safe_head = head - config.CONFIRMATION_BLOCKS
+
+        if self.last_block is None:
+            self._resume(CursorService.get_last_block(self.listener, self.contract_address))
+
+        return self._range()
+
+    async def next_range_async(self, head: int) -> Optional[Tuple[int, int]]:
+        """next_range для слушателей на asyncio: курсор читается через AsyncCursorService"""
+        self.head = head
+        self.safe_head = head - config.CONFIRMATION_BLOCKS
+
+        if self.last_block is None:
+            self._resume(await AsyncCursorService.get_last_block(self.listener, self.contract_address))
+
+        return self._range()
+
+    def _resume(self, last_block: Optional[int]):
+        self.last_block = last_block
+        if self.last_block is None:
+            self.last_block = self._initial_block(self.safe_head)
+        logger.info(f"[{self.listener}] Resuming from block {self.last_block + 1}")
+
+    def _range(self) -> Optional[Tuple[int, int]]:
+        if self.safe_head <= self.last_block:
+            return None
+
+        from_block = self.last_block + 1
+        to_block = min(self.safe_head, self.last_block + config.MAX_BLOCK_RANGE)
+        return from_block, to_block
+
+    def commit(self, to_block: int, batch: EventBatch = None):
+        """
+        Зафиксировать, что все блоки до to_block включительно обработаны.
+        Если передан batch, он записывается в той же транзакции, что и курсор,
+        а записи на глубине CONFIRMATION_DEPTH от head переводятся в CONFIRMED.
+        """
+        if batch is not None:
+            TransactionService.write_event_batch(
+                batch,
+                cursor=(self.listener, self.contract_address, to_block),
+                confirm_up_to=self.head - config.CONFIRMATION_DEPTH
+            )
+        else:
+            CursorService.save_last_block(self.listener, self.contract_address, to_block)
+        self.last_block = to_block
+
+    async def commit_async(self, to_block: int, batch: EventBatch = None):
+        """commit через AsyncTransactionService: запись не блокирует цикл событий"""
+        if batch is not None:
+            await AsyncTransactionService.write_event_batch(
+                batch,
+                cursor=(self.listener, self.contract_address, to_block),
+                confirm_up_to=self.head - config.CONFIRMATION_DEPTH
+            )
+        else:
+            await AsyncCursorService.save_last_block(self.listener, self.contract_address, to_block)
+        self.last_block = to_block
+
+    @property
+    def is_lagging(self) -> bool:
+        """Курсор отстает от safe head (диапазон был обрезан MAX_BLOCK_RANGE)"""
+        return self.safe_head is not None and self.last_block < self.safe_head
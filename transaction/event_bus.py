@@ -0,0 +1,149 @@
+import logging
+import asyncio
+import aiohttp
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class EventSink:
+    """Получатель уведомлений; send вызывается с пачкой событий"""
+    name = 'sink'
+
+    async def start(self):
+        pass
+
+    async def send(self, events: list):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LoggingSink(EventSink):
+    name = 'log'
+
+    async def send(self, events: list):
+        for event in events:
+            logger.info(f"[EventBus] {event}")
+
+
+class WebhookSink(EventSink):
+    """
+    POST пачки событий на webhook бота:
+    {"events": [{"type": "WINNER_PICKED", ...}, ...]}
+    """
+    name = 'webhook'
+
+    def __init__(self, url: str, secret: str = None, timeout: float = 10, session: aiohttp.ClientSession = None):
+        self.url = url
+        self.secret = secret
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = session
+        self._own_session = session is None
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+
+    async def send(self, events: list):
+        headers = {}
+        if self.secret:
+            headers['Authorization'] = f"Bearer {self.secret}"
+
+        async with self.session.post(self.url, json={'events': events}, headers=headers) as response:
+            if response.status >= 300:
+                body = await response.text()
+                raise RuntimeError(f"Webhook returned {response.status}: {body[:200]}")
+
+    async def close(self):
+        if self._own_session and self.session and not self.session.closed:
+            await self.session.close()
+
+
+class EventBus:
+    """
+    Ограниченная асинхронная шина уведомлений от слушателей к боту.
+
+    У каждого получателя своя очередь на EVENT_BUS_QUEUE_SIZE событий и свой
+    воркер, который отправляет события пачками до EVENT_BUS_BATCH_SIZE с
+    повторами и экспоненциальной задержкой. publish никогда не ждет: если
+    медленный получатель не успевает и его очередь заполнена, самое старое
+    событие в ней отбрасывается, а цикл чтения логов продолжает работу.
+    """
+    def __init__(self, queue_size: int = None, batch_size: int = None, max_retries: int = None):
+        self.queue_size = queue_size or config.EVENT_BUS_QUEUE_SIZE
+        self.batch_size = batch_size or config.EVENT_BUS_BATCH_SIZE
+        self.max_retries = max_retries if max_retries is not None else config.EVENT_BUS_MAX_RETRIES
+        self._sinks = []  # (sink, queue)
+        self._workers = []
+        self.dropped = 0
+
+    def add_sink(self, sink: EventSink):
+        self._sinks.append((sink, asyncio.Queue(maxsize=self.queue_size)))
+
+    async def start(self):
+        for sink, queue in self._sinks:
+            await sink.start()
+            self._workers.append(asyncio.create_task(self._run_sink(sink, queue)))
+        logger.info(f"Event bus started with sinks: {[sink.name for sink, _ in self._sinks]}")
+
+    def publish(self, event: dict):
+        """Поставить событие в очереди всех получателей без ожидания"""
+        for sink, queue in self._sinks:
+            if queue.full():
+                queue.get_nowait()
+                queue.task_done()
+                self.dropped += 1
+                logger.warning(f"[EventBus] Sink '{sink.name}' is falling behind, dropped oldest event")
+            queue.put_nowait(event)
+
+    async def _run_sink(self, sink: EventSink, queue: asyncio.Queue):
+        while True:
+            events = [await queue.get()]
+            while len(events) < self.batch_size and not queue.empty():
+                events.append(queue.get_nowait())
+
+            await self._send_with_retry(sink, events)
+            for _ in events:
+                queue.task_done()
+
+    async def _send_with_retry(self, sink: EventSink, events: list):
+        delay = 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                await sink.send(events)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"[EventBus] Sink '{sink.name}' failed, dropping {len(events)} events: {e}")
+                    return
+                logger.warning(f"[EventBus] Sink '{sink.name}' error (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def stop(self, timeout: float = 5):
+        """Дождаться отправки очередей (не дольше timeout) и остановить воркеры"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for _, queue in self._sinks)),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("[EventBus] Stopped with undelivered events")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for sink, _ in self._sinks:
+            await sink.close()
+
+
+def build_event_bus() -> EventBus:
+    """Шина с получателями из настроек"""
+    bus = EventBus()
+    if config.BOT_WEBHOOK_URL:
+        bus.add_sink(WebhookSink(config.BOT_WEBHOOK_URL, secret=config.BOT_WEBHOOK_SECRET))
+    else:
+        bus.add_sink(LoggingSink())
+    return bus
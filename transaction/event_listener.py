@@ -1,145 +1,107 @@
 import logging
 import asyncio
 from contracts.raffle_service import RaffleService
-from database.db_service import UserService, TransactionService
-
-from backend.main import consume_generator
+from contracts.async_raffle_service import AsyncRaffleService
+from database.db_service import EventBatch
+from database.async_db_service import async_db_manager
+from database.address_index import address_index
+from transaction.log_ingestor import LogIngestor
 
 logger = logging.getLogger(__name__)
 
 
 class EventListener:
-    def __init__(self):
-        self.contract_manager = RaffleService()
-        self.poll_interval = 5  # секунд
+    """
+    Обработчики событий лотереи. Логи читает LogIngestor (см. register);
+    обработчикам нужны только контракты, поэтому подходит и AsyncRaffleService.
+    """
+    def __init__(self, contract_manager=None):
+        self.contract_manager = contract_manager or RaffleService()
     
-    async def listen_for_winner(self, run_once=False):
+    def register(self, ingestor):
+        """Зарегистрировать обработчики событий лотереи в LogIngestor"""
+        events = self.contract_manager.raffle_contract.events
+        ingestor.register(events.WinnerSelected, self.handle_winner)
+        ingestor.register(events.Deposited, self.handle_entry)
+    
+    def handle_winner(self, event, batch: EventBatch):
         """
-        Слушать событие WinnerPicked (победитель выбран)
+        Обработать одно событие WinnerSelected
+        
+        Запись WIN_PRIZE добавляется в batch; выигрыш пользователя
+        начисляется при записи batch, только если запись новая
         
-        Args:
-            run_once: Если True, проверит только один раз и выйдет
+        Returns:
+            Уведомление для бота или None
         """
-        logger.info("Starting WinnerPicked listener...")
+        winner_address = event['args']['winner']
+        prize_amount = event['args']['winningAmount']
+        tx_hash = event['transactionHash'].hex()
+        log_index = event['logIndex']
+        block_number = event['blockNumber']
+        block_hash = event['blockHash'].hex()
         
-
-        while True:
-            try:
-                current_block = self.contract_manager.w3.eth.block_number
-                last_checked_block = max(current_block - 100, 0)
-
-                winner_events = self.contract_manager.raffle_contract.events.WinnerSelected.get_logs(
-                    fromBlock=last_checked_block,
-                    toBlock=current_block
-                )
-                
-                for event in winner_events:
-                    winner_address = event['args']['winner']
-                    prize_amount = event['args']['winningAmount']
-                    tx_hash = event['transactionHash'].hex()
-                    block_number = event['blockNumber']
-                    
-                    logger.info(f"🎉 WinnerSelected event detected!")
-                    logger.info(f"Winner: {winner_address}")
-                    logger.info(f"Prize: {prize_amount} wei")
-                    logger.info(f"Tx: {tx_hash}")
-                    
-                    user = UserService.get_user_by_address(winner_address)
-                    
-                    if user:
-                        logger.info(f"Winner found in DB: {user.tg_id}")
-                        
-                        UserService.get_session().query(UserService.User).filter(
-                            UserService.User.evm_address == winner_address
-                        ).update({
-                            UserService.User.total_winnings: UserService.User.total_winnings + prize_amount,
-                            UserService.User.is_in_current_raffle: False
-                        })
-                        
-                        TransactionService.create_transaction(
-                            tg_id=user.tg_id,
-                            tx_hash=tx_hash,
-                            tx_type='WIN_PRIZE',
-                            from_addr=self.contract_manager.raffle_contract.address,
-                            to_addr=winner_address,
-                            amount=prize_amount
-                        )
-                        
-                        TransactionService.mark_transaction_confirmed(tx_hash, block_number=block_number)
-                        
-                        yield {
-                            'type': 'WINNER_PICKED',
-                            'winner_tg_id': user.tg_id,
-                            'winner_address': winner_address,
-                            'prize_amount': prize_amount,
-                            'tx_hash': tx_hash
-                        }
-                    else:
-                        logger.warning(f"Winner not found in DB: {winner_address}")
-                
-
-                if run_once:
-                    break
-                
-                await asyncio.sleep(self.poll_interval)
-            
-            except Exception as e:
-                logger.error(f"Error in winner listener: {e}")
-                if run_once:
-                    raise
-                await asyncio.sleep(self.poll_interval)
+        logger.info(f"🎉 WinnerSelected event detected!")
+        logger.info(f"Winner: {winner_address}")
+        logger.info(f"Prize: {prize_amount} wei")
+        logger.info(f"Tx: {tx_hash}")
+        
+        tg_id = address_index.get_tg_id(winner_address)
+        
+        if not tg_id:
+            logger.warning(f"Winner not found in DB: {winner_address}")
+            return None
+        
+        logger.info(f"Winner found in DB: {tg_id}")
+        
+        batch.add_transaction(
+            tg_id=tg_id,
+            tx_hash=tx_hash,
+            log_index=log_index,
+            tx_type='WIN_PRIZE',
+            from_addr=self.contract_manager.raffle_contract.address,
+            to_addr=winner_address,
+            amount=prize_amount,
+            block_number=block_number,
+            block_hash=block_hash
+        )
+        
+        return {
+            'type': 'WINNER_PICKED',
+            'winner_tg_id': tg_id,
+            'winner_address': winner_address,
+            'prize_amount': prize_amount,
+            'tx_hash': tx_hash
+        }
     
-    async def listen_for_entries(self, run_once=False):
+    def handle_entry(self, event, batch: EventBatch):
         """
-        Слушать событие RaffleEnter (пользователь входит в лотерею)
+        Обработать одно событие Deposited (вход в лотерею)
         
-        Args:
-            run_once: Если True, проверит только один раз и выйдет
+        Returns:
+            Уведомление для бота или None
         """
-        logger.info("Starting RaffleEnter listener...")
+        player_address = event['args']['participant']
+        tx_hash = event['transactionHash'].hex()
+        block_number = event['blockNumber']
+        block_hash = event['blockHash'].hex()
         
-
-        while True:
-            try:
-
-                current_block = self.contract_manager.w3.eth.block_number
-                last_checked_block = max(current_block - 100, 0)
-
-                entry_events = self.contract_manager.raffle_contract.events.Deposited.get_logs(
-                    fromBlock=last_checked_block,
-                    toBlock=current_block
-                )
-                
-                for event in entry_events:
-                    player_address = event['args']['participant']
-                    tx_hash = event['transactionHash'].hex()
-                    block_number = event['blockNumber']
-                    
-                    logger.info(f"RaffleEnter event: {player_address} (tx: {tx_hash})")
-                    
-                    user = UserService.get_user_by_address(player_address)
-                    if user:
-                        TransactionService.mark_transaction_confirmed(tx_hash, block_number=block_number)
-                        
-                        logger.info(f"Entry confirmed for {user.tg_id}")
-                        
-                        yield {
-                            'type': 'RAFFLE_ENTER',
-                            'tg_id': user.tg_id,
-                            'player_address': player_address,
-                            'tx_hash': tx_hash
-                        }
-                
-                if run_once:
-                    break
-                
-                await asyncio.sleep(self.poll_interval)
-            
-            except Exception as e:
-                logger.error(f"Error in entry listener: {e}")
-                if run_once:
-                    raise
-                await asyncio.sleep(self.poll_interval)
+        logger.info(f"RaffleEnter event: {player_address} (tx: {tx_hash})")
+        
+        tg_id = address_index.get_tg_id(player_address)
+        if not tg_id:
+            return None
+        
+        batch.confirm(tx_hash, block_number=block_number, block_hash=block_hash)
+        
+        logger.info(f"Entry confirmed for {tg_id}")
+        
+        return {
+            'type': 'RAFFLE_ENTER',
+            'tg_id': tg_id,
+            'player_address': player_address,
+            'tx_hash': tx_hash
+        }
 
 
 async def run_event_listener():
@@ -147,15 +109,16 @@ async def run_event_listener():
     Основной loop, который слушает ВСЕ события
     (интеграция с Роль 4 - Event Listener & DevOps)
     """
-    listener = EventListener()
+    contract_manager = await AsyncRaffleService.create()
+    ingestor = LogIngestor(contract_manager)
+    EventListener(contract_manager).register(ingestor)
     
-    winner_task = asyncio.create_task(consume_generator(listener.listen_for_winner()))
-    entry_task = asyncio.create_task(consume_generator(listener.listen_for_entries()))
-    
-    async for notification in winner_task:
-        logger.info(f"Notification: {notification}")
-
-    await asyncio.gather(winner_task, entry_task)
+    try:
+        async for notification in ingestor.run():
+            logger.info(f"Notification: {notification}")
+    finally:
+        await contract_manager.close()
+        await async_db_manager.dispose()
 
 
 if __name__ == "__main__":
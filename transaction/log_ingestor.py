@@ -0,0 +1,198 @@
+import logging
+import asyncio
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+from config.settings import config
+from contracts.async_raffle_service import AsyncRaffleService
+from database.db_service import EventBatch
+from database.address_index import address_index
+from transaction.reorg_guard import ReorgGuard
+from transaction.block_cursor import BlockCursor
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(values: list, size: int):
+    """Разбить список на части не длиннее size"""
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def address_to_topic(address) -> str:
+    """Адрес (строка 0x... или 20 байт) в формате индексированного topic"""
+    if isinstance(address, (bytes, bytearray)):
+        return '0x' + '0' * 24 + bytes(address).hex()
+    return '0x' + '0' * 24 + address[2:].lower()
+
+
+class LogIngestor:
+    """
+    Единый цикл чтения логов для raffle и USDT контрактов.
+
+    На каждый диапазон блоков делается один eth_getLogs сразу по всем
+    зарегистрированным адресам с OR-фильтром по topic0. Каждый лог
+    декодируется по (address, topic0) и передается своему обработчику,
+    поэтому все обработчики видят один и тот же срез цепочки.
+
+    Для событий с indexed_filter значения индексированного аргумента
+    передаются в фильтр ноды (частями по TOPIC_FILTER_CHUNK_SIZE), и такие
+    события запрашиваются отдельным eth_getLogs на каждую часть.
+
+    RPC идут через AsyncWeb3, все eth_getLogs одного диапазона
+    выполняются параллельно.
+    """
+    def __init__(self, contract_manager: AsyncRaffleService, name: str = 'ingestor'):
+        self.contract_manager = contract_manager
+        self.w3 = self.contract_manager.w3
+        self.name = name
+        self.poll_interval = 5  # секунд
+
+        # (address, topic0) -> (декодер события, обработчик)
+        self._handlers = {}
+        # (address, topic0) -> (позиция topic, функция, возвращающая значения topic)
+        self._indexed_filters = {}
+        self.cursor = None
+        self.reorg_guard = ReorgGuard(self.w3)
+
+    def register(self, event, handler, indexed_filter=None):
+        """
+        Зарегистрировать обработчик события контракта
+
+        Args:
+            event: Событие контракта, например contract.events.WinnerSelected
+            handler: handler(decoded_event, batch) -> уведомление (dict) или None;
+                изменения БД обработчик добавляет в batch (EventBatch)
+            indexed_filter: (позиция topic, provider) - provider() возвращает список
+                значений индексированного аргумента в формате topic; логи с другими
+                значениями нода отфильтрует сама
+        """
+        decoder = event()
+        address = Web3.to_checksum_address(decoder.address)
+        topic0 = event_abi_to_log_topic(decoder.abi)
+        self._handlers[(address, topic0)] = (decoder, handler)
+        if indexed_filter:
+            self._indexed_filters[(address, topic0)] = indexed_filter
+        else:
+            self._indexed_filters.pop((address, topic0), None)
+        self.cursor = None  # набор адресов изменился - курсор другой
+        logger.info(f"[{self.name}] Registered handler for {decoder.event_name} at {address}")
+
+    @property
+    def addresses(self) -> list:
+        return sorted({address for address, _ in self._handlers})
+
+    def _unfiltered_keys(self) -> list:
+        return [key for key in self._handlers if key not in self._indexed_filters]
+
+    def _get_cursor(self) -> BlockCursor:
+        if self.cursor is None:
+            self.cursor = BlockCursor(self.w3, self.name, ','.join(self.addresses))
+        return self.cursor
+
+    async def fetch_logs(self, from_block: int, to_block: int) -> list:
+        """
+        Логи всех зарегистрированных событий за диапазон: один eth_getLogs
+        по всем адресам и topic0 плюс запросы с фильтрами по indexed-аргументам
+        """
+        filters = []
+
+        keys = self._unfiltered_keys()
+        if keys:
+            filters.append({
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'address': sorted({address for address, _ in keys}),
+                'topics': [sorted({Web3.to_hex(topic0) for _, topic0 in keys})]
+            })
+
+        for (address, topic0), (position, provider) in self._indexed_filters.items():
+            for values in chunked(provider(), config.TOPIC_FILTER_CHUNK_SIZE):
+                filters.append({
+                    'fromBlock': from_block,
+                    'toBlock': to_block,
+                    'address': address,
+                    'topics': [Web3.to_hex(topic0)] + [None] * (position - 1) + [values]
+                })
+
+        results = await asyncio.gather(*(self.w3.eth.get_logs(log_filter) for log_filter in filters))
+        logs = [log for result in results for log in result]
+        return sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex']))
+
+    def dispatch(self, log, batch: EventBatch):
+        """Декодировать лог по topic0 и передать обработчику"""
+        if not log['topics']:
+            return None
+
+        key = (Web3.to_checksum_address(log['address']), bytes(log['topics'][0]))
+        entry = self._handlers.get(key)
+        if entry is None:
+            return None
+
+        decoder, handler = entry
+        event = decoder.process_log(log)
+        return handler(event, batch)
+
+    async def run(self, run_once=False):
+        """
+        Запустить цикл чтения логов
+
+        Args:
+            run_once: Если True, обработает один диапазон и выйдет
+
+        Yields:
+            Уведомления, которые вернули обработчики
+        """
+        if not self._handlers:
+            raise ValueError("No event handlers registered")
+
+        logger.info(f"[{self.name}] Starting log ingestion for {self.addresses}...")
+        cursor = self._get_cursor()
+
+        while True:
+            try:
+                head = await self.w3.eth.block_number
+                block_range = await cursor.next_range_async(head)
+                if await self.reorg_guard.check(cursor):
+                    block_range = await cursor.next_range_async(head)
+                if block_range is None:
+                    if run_once:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                from_block, to_block = block_range
+
+                # Пользователи, созданные процессом API до этого head: их адреса нужны
+                # и в фильтрах по topic, и обработчикам логов этого диапазона
+                await asyncio.to_thread(address_index.refresh)
+
+                to_block_hash, logs = await asyncio.gather(
+                    self.reorg_guard.block_hash(to_block),
+                    self.fetch_logs(from_block, to_block)
+                )
+                logger.debug(f"[{self.name}] {len(logs)} logs in blocks {from_block} - {to_block}")
+
+                batch = EventBatch()
+                ReorgGuard.record(batch, logs, to_block, to_block_hash)
+                notifications = []
+                for log in logs:
+                    notification = self.dispatch(log, batch)
+                    if notification:
+                        notifications.append(notification)
+
+                # Все записи опроса и курсор - одной транзакцией
+                await cursor.commit_async(to_block, batch)
+
+                for notification in notifications:
+                    yield notification
+
+                if run_once:
+                    break
+
+                if not cursor.is_lagging:
+                    await asyncio.sleep(self.poll_interval)
+
+            except Exception as e:
+                logger.error(f"[{self.name}] Error in log ingestion: {e}")
+                if run_once:
+                    raise
+                await asyncio.sleep(self.poll_interval)
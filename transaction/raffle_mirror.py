@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+from config.settings import config
+from contracts.raffle_snapshot import RAFFLE_STATES
+
+logger = logging.getLogger(__name__)
+
+MIRRORED_EVENTS = [
+    'RaffleCreated', 'Deposited', 'RandomnessRequested', 'WinnerSelected', 'RaffleCancelled', 'ProtocolFeeUpdated'
+]
+
+BPS_DENOMINATOR = 10000
+
+STATE_OPEN = 0
+STATE_CALCULATING = 1
+
+
+class RaffleMirror:
+    """
+    Копия состояния текущей лотереи в памяти процесса API.
+
+    Состояние один раз читается из контракта (RaffleSnapshot), дальше фоновый
+    поток забирает логи RaffleCreated, Deposited, RandomnessRequested,
+    WinnerSelected и RaffleCancelled одним eth_getLogs на опрос и применяет их.
+    Депозит увеличивает prize_pool за вычетом комиссии протокола (s_protocolFeeBps
+    из снимка). Редкие события (WinnerSelected, RaffleCancelled, ProtocolFeeUpdated)
+    и реорганизации приводят к повторному чтению снимка. Статус отдается из памяти без RPC.
+    """
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval or config.MIRROR_POLL_INTERVAL
+        self.contract_manager = None
+        self._lock = threading.Lock()
+        self._state = None
+        self._last_block_hash = None
+        self._decoders = {}  # topic0 -> событие контракта
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._state is not None
+
+    def start(self, contract_manager):
+        """Запустить фоновое обновление (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.contract_manager = contract_manager
+            events = contract_manager.raffle_contract.events
+            self._decoders = {
+                event_abi_to_log_topic(getattr(events, name)().abi): getattr(events, name)()
+                for name in MIRRORED_EVENTS
+            }
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='raffle-mirror', daemon=True)
+            self._thread.start()
+        logger.info("Raffle mirror started")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval * 2)
+
+    def status(self) -> dict:
+        """Текущее состояние лотереи или None, если копия еще не загружена"""
+        with self._lock:
+            if self._state is None:
+                return None
+            state = dict(self._state)
+        del state['protocol_fee_bps']
+
+        if state['end_time'] is not None:
+            state['time_remaining'] = max(state['end_time'] - int(time.time()), 0)
+        state['state'] = RAFFLE_STATES.get(state['state'], 'UNKNOWN')
+        return state
+
+    def seed(self):
+        """Загрузить состояние из контракта одним снимком"""
+        snapshot = self.contract_manager.get_snapshot()
+        block_hash = self._get_block_hash(snapshot.block_number)
+        with self._lock:
+            self._state = {
+                'raffle_id': snapshot.raffle_id,
+                'state': snapshot.state,
+                'deposit_amount': snapshot.deposit_amount,
+                'participants_count': snapshot.participants_count,
+                'prize_pool': snapshot.prize_pool,
+                'total_deposits': snapshot.total_deposits,
+                'protocol_fee_bps': snapshot.protocol_fee_bps,
+                'start_time': snapshot.start_time,
+                'end_time': snapshot.end_time,
+                'winner': snapshot.winner,
+                'claimed': snapshot.claimed,
+                'block_number': snapshot.block_number
+            }
+            self._last_block_hash = block_hash
+        logger.info(f"Raffle mirror seeded at block {snapshot.block_number}")
+
+    def _get_block_hash(self, block_number: int) -> str:
+        return Web3.to_hex(self.contract_manager.w3.eth.get_block(block_number)['hash'])
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._state is None:
+                    self.seed()
+                else:
+                    self.poll()
+            except Exception as e:
+                logger.error(f"Error in raffle mirror: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def poll(self):
+        """Применить логи новых блоков"""
+        w3 = self.contract_manager.w3
+        last_block = self._state['block_number']
+
+        if self._get_block_hash(last_block) != self._last_block_hash:
+            logger.warning(f"Raffle mirror: block {last_block} was reorganized, reseeding")
+            self.seed()
+            return
+
+        head = w3.eth.block_number
+        if head <= last_block:
+            return
+        to_block = min(head, last_block + config.MAX_BLOCK_RANGE)
+
+        logs = w3.eth.get_logs({
+            'fromBlock': last_block + 1,
+            'toBlock': to_block,
+            'address': self.contract_manager.raffle_contract.address,
+            'topics': [[Web3.to_hex(topic0) for topic0 in self._decoders]]
+        })
+        logs = sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex']))
+
+        reseed = False
+        with self._lock:
+            for log in logs:
+                event = self._decoders[bytes(log['topics'][0])].process_log(log)
+                reseed = self._apply(event) or reseed
+
+        if reseed:
+            self.seed()
+            return
+
+        block_hash = self._get_block_hash(to_block)
+        with self._lock:
+            self._state['block_number'] = to_block
+            self._last_block_hash = block_hash
+
+    def _apply(self, event) -> bool:
+        """
+        Применить событие к состоянию (под блокировкой)
+
+        Returns:
+            True, если состояние нужно перечитать из контракта
+        """
+        state = self._state
+        args = event['args']
+        name = event['event']
+
+        if name == 'RaffleCreated':
+            state.update({
+                'raffle_id': args['raffleId'],
+                'state': STATE_OPEN,
+                'deposit_amount': args['depositAmount'],
+                'participants_count': 0,
+                'prize_pool': 0,
+                'total_deposits': 0,
+                'start_time': args['startTime'],
+                'end_time': args['endTime'],
+                'claimed': False
+            })
+            return False
+
+        if name == 'ProtocolFeeUpdated':
+            # Как новая комиссия отражается на текущем призовом фонде, решает контракт
+            return True
+
+        if args['raffleId'] != state['raffle_id']:
+            return False
+
+        if name == 'Deposited':
+            state['participants_count'] = (state['participants_count'] or 0) + 1
+            state['total_deposits'] = (state['total_deposits'] or 0) + args['amount']
+            if state['protocol_fee_bps'] is None:
+                # Комиссия не прочиталась в снимке: фонд берем из контракта
+                return True
+            fee = args['amount'] * state['protocol_fee_bps'] // BPS_DENOMINATOR
+            state['prize_pool'] = (state['prize_pool'] or 0) + args['amount'] - fee
+            return False
+
+        if name == 'RandomnessRequested':
+            state['state'] = STATE_CALCULATING
+            return False
+
+        # WinnerSelected, RaffleCancelled: итоговые суммы и состояние считает контракт
+        if name == 'WinnerSelected':
+            state['winner'] = args['winner']
+        return True
+
+
+raffle_mirror = RaffleMirror()
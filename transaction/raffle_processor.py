@@ -1,10 +1,19 @@
 import logging
-import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
 from contracts.raffle_service import RaffleService
-from database.db_service import UserService, TransactionService
+from database.models import db_manager
+from database.db_service import UserService, TransactionService, EventBatch, EntryJobService
+from database.address_index import address_index
 from wallet.wallet_manager import WalletManager
+from wallet.signing_service import signing_service
+from contracts.receipt_tracker import receipt_tracker
+from transaction.raffle_mirror import raffle_mirror
+from transaction.balance_ledger import balance_ledger
+from transaction.log_ingestor import address_to_topic
+from config.settings import config
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +23,21 @@ class RaffleProcessor:
         self.contract_manager = RaffleService()
         self.wallet_manager = WalletManager()
     
-    def process_user_entry(self, tg_id: str, evm_address: str, encrypted_key: str) -> dict:
+    def start(self):
+        """
+        Запустить фоновые службы процесса API (вызывается явно при старте сервера,
+        а не при импорте: режимам listeners, backfill и rotate-keys они не нужны)
+        """
+        # Процессы подписи поднимаются до фоновых потоков
+        signing_service.start()
+        # Один фоновый поток проверяет receipt всех транзакций в полете
+        receipt_tracker.start()
+        # Статус лотереи отдается из копии в памяти, обновляемой по событиям
+        raffle_mirror.start(self.contract_manager)
+        if config.BALANCE_LEDGER_ENABLED and hasattr(self.contract_manager, 'usdt_contract'):
+            balance_ledger.start(self.contract_manager)
+    
+    def process_user_entry(self, tg_id: str, evm_address: str, encrypted_key: str, hd_index: int = None) -> dict:
         """
         Обработать вход пользователя в лотерею
         
@@ -22,6 +45,7 @@ class RaffleProcessor:
             tg_id: Telegram ID пользователя
             evm_address: EVM адрес кошелька
             encrypted_key: Зашифрованный приватный ключ
+            hd_index: Индекс HD-кошелька (вместо encrypted_key)
         
         Returns:
             {
@@ -33,24 +57,28 @@ class RaffleProcessor:
         try:
             logger.info(f"Processing entry for user {tg_id} ({evm_address})")
             
-            private_key = self.wallet_manager.decrypt_private_key(encrypted_key)
-            
             raffle_state = self.contract_manager.get_raffle_state()
             if raffle_state != 0:  # 0 = OPEN
                 raise ValueError("Raffle is not open for entries")
             
-            tx_hash = self.contract_manager.enter_raffle(evm_address, private_key)
-            
-            TransactionService.create_transaction(
-                tg_id=tg_id,
-                tx_hash=tx_hash,
-                tx_type='ENTER_RAFFLE',
-                from_addr=evm_address,
-                to_addr=self.contract_manager.raffle_contract.address,
-                amount=self.contract_manager.get_entrance_fee()
+            tx_hash = self.contract_manager.enter_raffle(
+                evm_address, balance=balance_ledger.balance(evm_address),
+                **self._signing_credentials(encrypted_key, hd_index)
             )
             
-            UserService.mark_in_raffle(tg_id)
+            entrance_fee = self.contract_manager.get_entrance_fee()
+            
+            with db_manager.session_scope():
+                TransactionService.create_transaction(
+                    tg_id=tg_id,
+                    tx_hash=tx_hash,
+                    tx_type='ENTER_RAFFLE',
+                    from_addr=evm_address,
+                    to_addr=self.contract_manager.raffle_contract.address,
+                    amount=entrance_fee
+                )
+                
+                UserService.mark_in_raffle(tg_id)
             
             logger.info(f"Entry processed for {tg_id}. Tx: {tx_hash}")
             
@@ -68,29 +96,192 @@ class RaffleProcessor:
                 'error': str(e)
             }
     
+    def submit_user_entry(self, tg_id: str, evm_address: str, encrypted_key: str, hd_index: int = None) -> dict:
+        """
+        Отправить вход пользователя в лотерею без ожидания receipt
+        
+        Транзакции подписываются и отправляются, статус затем отслеживается
+        через get_entry_status(job_id).
+        
+        Returns:
+            {
+                'success': bool,
+                'job_id': str,
+                'tx_hash': str,
+                'error': str (если ошибка)
+            }
+        """
+        try:
+            raffle_state = self.contract_manager.get_raffle_state()
+            if raffle_state != 0:  # 0 = OPEN
+                raise ValueError("Raffle is not open for entries")
+            
+            return self._submit_entry(
+                tg_id, evm_address, encrypted_key, self.contract_manager.get_entrance_fee(), hd_index
+            )
+        
+        except Exception as e:
+            logger.error(f"Error submitting entry for {tg_id}: {e}")
+            return {
+                'success': False,
+                'job_id': None,
+                'tx_hash': None,
+                'error': str(e)
+            }
+    
+    def _submit_entry(self, tg_id: str, evm_address: str, encrypted_key: str, entrance_fee: int,
+                      hd_index: int = None) -> dict:
+        """Подписать и отправить вход одного пользователя (состояние лотереи уже проверено)"""
+        logger.info(f"Submitting entry for user {tg_id} ({evm_address})")
+        
+        tx_hash = self.contract_manager.enter_raffle(
+            evm_address, wait=False,
+            balance=balance_ledger.balance(evm_address), entrance_fee=entrance_fee,
+            **self._signing_credentials(encrypted_key, hd_index)
+        )
+        
+        # Запись транзакции и задачи - один коммит
+        with db_manager.session_scope():
+            TransactionService.create_transaction(
+                tg_id=tg_id,
+                tx_hash=tx_hash,
+                tx_type='ENTER_RAFFLE',
+                from_addr=evm_address,
+                to_addr=self.contract_manager.raffle_contract.address,
+                amount=entrance_fee
+            )
+            
+            job = EntryJobService.create_job(tg_id, tx_hash)
+        
+        logger.info(f"Entry submitted for {tg_id}. Job: {job.job_id}, Tx: {tx_hash}")
+        
+        return {
+            'success': True,
+            'job_id': job.job_id,
+            'tx_hash': tx_hash,
+            'error': None
+        }
+    
+    def _signing_credentials(self, encrypted_key: str, hd_index: int = None) -> dict:
+        """
+        Аргументы подписи для enter_raffle: signer из пула процессов (ключ
+        расшифровывается или выводится в воркере) или ключ, полученный здесь же
+        """
+        if signing_service.enabled:
+            return {'signer': partial(signing_service.sign, encrypted_key, hd_index=hd_index)}
+        return {'user_private_key': self.wallet_manager.get_private_key(encrypted_key, hd_index)}
+    
+    def submit_bulk_entries(self, tg_ids: list, max_workers: int = None) -> list:
+        """
+        Отправить вход в лотерею для многих пользователей
+        
+        Состояние лотереи и размер депозита читаются один раз, дальше
+        пользователи обрабатываются пулом из BULK_ENTRY_WORKERS потоков:
+        расшифровка ключа, подпись и отправка без ожидания receipt.
+        Статус каждого входа - через get_entry_status(job_id).
+        
+        Returns:
+            [{'tg_id', 'success', 'job_id', 'tx_hash', 'error'}, ...] в порядке tg_ids
+        """
+        tg_ids = [str(tg_id) for tg_id in tg_ids]
+        
+        raffle_state = self.contract_manager.get_raffle_state()
+        if raffle_state != 0:  # 0 = OPEN
+            raise ValueError("Raffle is not open for entries")
+        entrance_fee = self.contract_manager.get_entrance_fee()
+        
+        users = UserService.get_users_by_tg_ids(tg_ids)
+        
+        def submit(tg_id):
+            user = users.get(tg_id)
+            if not user:
+                return {'tg_id': tg_id, 'success': False, 'job_id': None, 'tx_hash': None,
+                        'error': 'User not found'}
+            try:
+                result = self._submit_entry(
+                    tg_id, user.evm_address, user.encrypted_private_key, entrance_fee, user.hd_index
+                )
+            except Exception as e:
+                logger.error(f"Error submitting entry for {tg_id}: {e}")
+                result = {'success': False, 'job_id': None, 'tx_hash': None, 'error': str(e)}
+            return {'tg_id': tg_id, **result}
+        
+        with ThreadPoolExecutor(max_workers=max_workers or config.BULK_ENTRY_WORKERS) as pool:
+            results = list(pool.map(submit, tg_ids))
+        
+        submitted = sum(1 for result in results if result['success'])
+        logger.info(f"Bulk entry: {submitted}/{len(tg_ids)} submitted")
+        return results
+    
+    def get_entry_status(self, job_id: str) -> dict:
+        """
+        Статус задачи входа в лотерею: PENDING, MINED или FAILED
+        
+        Returns:
+            dict задачи или None, если задача не найдена
+        """
+        job = EntryJobService.get_job(job_id)
+        if not job:
+            return None
+        
+        # Статус обновляет ReceiptTracker; прямой запрос - только если он не запущен
+        if job.status == 'PENDING' and not receipt_tracker.is_running:
+            receipt = self.contract_manager.get_receipt(job.tx_hash)
+            if receipt is not None:
+                if receipt.status == 1:
+                    with db_manager.session_scope():
+                        job = EntryJobService.update_job_status(job_id, 'MINED', block_number=receipt.blockNumber)
+                        UserService.mark_in_raffle(job.tg_id)
+                else:
+                    job = EntryJobService.update_job_status(
+                        job_id, 'FAILED', block_number=receipt.blockNumber, error='Transaction reverted'
+                    )
+        
+        return job.to_dict()
+    
     def check_user_balance(self, evm_address: str) -> int:
-        """Получить баланс USDT пользователя"""
+        """Получить баланс USDT пользователя (из balance_ledger, если адрес уже в нем)"""
         try:
-            balance = self.contract_manager.get_usdt_balance(evm_address)
+            balance = balance_ledger.balance(evm_address)
+            if balance is None:
+                balance = self.contract_manager.get_usdt_balance(evm_address)
             return balance
         except Exception as e:
             logger.error(f"Error checking balance: {e}")
             return 0
     
+    def check_user_balances(self, users: dict) -> dict:
+        """
+        Балансы USDT многих пользователей на одном блоке
+        
+        Args:
+            users: tg_id -> evm_address
+        
+        Returns:
+            {'block_number': int, 'balances': {tg_id: баланс или None}}
+        """
+        addresses = list(set(users.values()))
+        result = balance_ledger.balances(addresses)
+        if result is None:
+            result = self.contract_manager.get_usdt_balances(addresses)
+        balances, block_number = result
+        return {
+            'block_number': block_number,
+            'balances': {tg_id: balances[address] for tg_id, address in users.items()}
+        }
+    
     def get_raffle_status(self) -> dict:
-        """Получить статус текущей лотереи"""
+        """Получить статус текущей лотереи (из raffle_mirror, пока он загружается - из контракта)"""
         try:
-            players = self.contract_manager.get_players()
-            raffle_state = self.contract_manager.get_raffle_state()
-            entrance_fee = self.contract_manager.get_entrance_fee()
-            
-            states = {0: "OPEN", 1: "CALCULATING"}
+            status = raffle_mirror.status()
+            if status is None:
+                status = self.contract_manager.get_snapshot().to_dict()
             
             return {
-                'players_count': len(players),
-                'state': states.get(raffle_state, 'UNKNOWN'),
-                'entrance_fee': entrance_fee,
-                'pool': len(players) * entrance_fee
+                'players_count': status['participants_count'],
+                'entrance_fee': status['deposit_amount'],
+                'pool': status['prize_pool'],
+                **status
             }
         except Exception as e:
             logger.error(f"Error getting raffle status: {e}")
@@ -132,67 +323,63 @@ class RaffleProcessor:
 
 class DepositListener:
     """
-    Слушает входящие платежи в USDT на адреса пользователей
+    Входящие платежи в USDT на адреса пользователей (логи читает LogIngestor)
     """
-    def __init__(self):
-        self.contract_manager = RaffleService()
-        self.poll_interval = 10  # секунд
+    def __init__(self, contract_manager=None):
+        # Обработчику нужны только контракты - подходит и AsyncRaffleService
+        self.contract_manager = contract_manager or RaffleService()
+        
+        # Адреса пользователей в формате topic для фильтра Transfer по `to`
+        self._recipient_topics = []
+    
+    def register(self, ingestor):
+        """Зарегистрировать обработчик Transfer в LogIngestor"""
+        transfer = self.contract_manager.usdt_contract.events.Transfer
+        if config.DEPOSIT_DETECTION_MODE == 'topic':
+            # `to` - второй индексированный аргумент, topics[2]
+            ingestor.register(transfer, self.handle_transfer, indexed_filter=(2, self.recipient_topics))
+        else:
+            ingestor.register(transfer, self.handle_transfer)
     
-    async def listen_for_deposits(self, run_once=False):
+    def recipient_topics(self) -> list:
         """
-        Запустить слушателя входящих депозитов
-        
-        Args:
-            run_once: Если True, проверит только один раз и выйдет
+        Адреса пользователей для фильтра Transfer по получателю.
+        Список дополняется пользователями, созданными после прошлого вызова.
+        """
+        new_addresses = address_index.addresses_since(len(self._recipient_topics))
+        if new_addresses:
+            self._recipient_topics.extend(address_to_topic(address) for address in new_addresses)
+            logger.info(f"Deposit filter rebuilt: {len(self._recipient_topics)} addresses")
+        return self._recipient_topics
+    
+    def handle_transfer(self, log, batch: EventBatch):
+        """
+        Обработать один USDT Transfer; депозитом считается перевод на адрес пользователя.
+        Депозит пользователя обновляется при записи batch, только если запись новая.
         """
-        logger.info("Starting deposit listener...")
+        sender = log['args']['from']
+        recipient = log['args']['to']
+        amount = log['args']['value']
+        tx_hash = log['transactionHash'].hex()
         
-        while True:
-            try:
-                current_block = self.contract_manager.w3.eth.block_number
-                last_checked_block = max(0, current_block - 10)
-
-                logger.info(f"Checking for deposits. Block range: {last_checked_block} - {current_block}")
-                
-                transfer_logs = self.contract_manager.usdt_contract.events.Transfer.get_logs(
-                    fromBlock=last_checked_block,
-                    toBlock=current_block
-                )
-                
-                for log in transfer_logs:
-                    sender = log['args']['from']
-                    recipient = log['args']['to']
-                    amount = log['args']['value']
-                    tx_hash = log['transactionHash'].hex()
-                    
-                    user = UserService.get_user_by_address(recipient)
-                    
-                    if user:
-                        logger.info(f"Deposit detected for {user.tg_id}: {amount} wei (tx: {tx_hash})")
-                        
-                        UserService.update_user_deposit(user.tg_id, amount, tx_hash)
-                        
-                        TransactionService.create_transaction(
-                            tg_id=user.tg_id,
-                            tx_hash=tx_hash,
-                            tx_type='DEPOSIT',
-                            from_addr=sender,
-                            to_addr=recipient,
-                            amount=amount
-                        )
-                        
-                        logger.info(f"Deposit recorded for {user.tg_id}")
-                
-                if run_once:
-                    break
-                
-                await asyncio.sleep(self.poll_interval)
+        tg_id = address_index.get_tg_id(recipient)
+        
+        if tg_id:
+            logger.info(f"Deposit detected for {tg_id}: {amount} wei (tx: {tx_hash})")
             
-            except Exception as e:
-                logger.error(f"Error in deposit listener: {e}")
-                if run_once:
-                    raise
-                await asyncio.sleep(self.poll_interval)
+            batch.add_transaction(
+                tg_id=tg_id,
+                tx_hash=tx_hash,
+                log_index=log['logIndex'],
+                tx_type='DEPOSIT',
+                from_addr=sender,
+                to_addr=recipient,
+                amount=amount,
+                block_number=log['blockNumber'],
+                block_hash=log['blockHash'].hex()
+            )
+        
+        return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from web3 import Web3
+from database.db_service import EventBatch
+from database.async_db_service import AsyncBlockHashService, AsyncTransactionService
+from transaction.block_cursor import BlockCursor
+
+logger = logging.getLogger(__name__)
+
+
+class ReorgDetected(Exception):
+    pass
+
+
+class ReorgGuard:
+    """
+    Обнаружение реорганизаций для LogIngestor.
+
+    Для каждого обработанного диапазона сохраняются хеши блоков (в той же
+    транзакции, что и записи). Перед следующим опросом хеш последнего
+    обработанного блока сверяется с цепочкой; при расхождении ищется общий
+    предок по сохраненным хешам, неподтвержденные записи выше него
+    откатываются, и курсор возвращается на предка - диапазон переигрывается.
+    """
+    def __init__(self, w3):
+        self.w3 = w3
+
+    async def block_hash(self, block_number: int) -> str:
+        block = await self.w3.eth.get_block(block_number)
+        return Web3.to_hex(block['hash'])
+
+    async def check(self, cursor: BlockCursor) -> bool:
+        """
+        Проверить, что последний обработанный блок курсора все еще в цепочке
+
+        Returns:
+            True, если была реорганизация и выполнен откат
+        """
+        if cursor.last_block is None or cursor.last_block < 0:
+            return False
+
+        # Чтение сохраненного хеша из БД идет параллельно с запросом к ноде
+        stored, current = await asyncio.gather(
+            AsyncBlockHashService.get_block_hash(cursor.last_block),
+            self.block_hash(cursor.last_block)
+        )
+        if stored is None or stored == current:
+            return False
+
+        ancestor = await self._find_common_ancestor(cursor.last_block)
+        logger.warning(f"⚠️ Reorg detected at block {cursor.last_block}, common ancestor {ancestor}")
+
+        await AsyncTransactionService.rollback_after(ancestor, cursor=(cursor.listener, cursor.contract_address))
+        cursor.last_block = ancestor
+        return True
+
+    async def _find_common_ancestor(self, block_number: int) -> int:
+        """Последний сохраненный блок, хеш которого совпадает с цепочкой"""
+        stored_hashes = await AsyncBlockHashService.get_hashes_before(block_number)
+        for number, block_hash in stored_hashes:
+            if block_hash == await self.block_hash(number):
+                return number
+
+        oldest = stored_hashes[-1][0] if stored_hashes else block_number
+        logger.critical(f"No common ancestor within stored hashes, rolling back to block {oldest - 1}")
+        return max(oldest - 1, 0)
+
+    @staticmethod
+    def record(batch: EventBatch, logs: list, to_block: int, to_block_hash: str):
+        """
+        Сохранить в batch хеши блоков диапазона и проверить, что логи
+        получены из той же цепочки, что и заголовок последнего блока
+        """
+        try:
+            batch.record_block(to_block, to_block_hash)
+            for log in logs:
+                batch.record_block(log['blockNumber'], Web3.to_hex(log['blockHash']))
+        except ValueError as e:
+            raise ReorgDetected(str(e))
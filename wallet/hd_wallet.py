@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from eth_account import Account
+from eth_account.hdaccount import seed_from_mnemonic, key_from_seed
+from config.settings import config
+from database.db_service import UserService
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """LRU-кеш с ограничением размера и временем жизни записей"""
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (value, expires_at)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+class HDWallet:
+    """
+    Кошельки пользователей, выведенные из одного мастер-сида (WALLET_MODE=hd).
+
+    Мнемоника хранится зашифрованной ENCRYPTION_KEY в HD_MASTER_SEED и
+    расшифровывается один раз; у пользователя в БД хранится только индекс
+    hd_index, ключ выводится по пути HD_DERIVATION_PATH. Выведенные ключи
+    лежат в LRU-кеше с TTL (HD_KEY_CACHE_SIZE, HD_KEY_CACHE_TTL).
+    """
+    def __init__(self, wallet_manager):
+        self.wallet_manager = wallet_manager
+        self._lock = threading.Lock()
+        self._seed = None
+        self._next_index = None
+        self._keys = TTLCache(config.HD_KEY_CACHE_SIZE, config.HD_KEY_CACHE_TTL)
+
+    def _get_seed(self) -> bytes:
+        if self._seed is None:
+            with self._lock:
+                if self._seed is None:
+                    if not config.HD_MASTER_SEED:
+                        raise ValueError("HD_MASTER_SEED is not configured")
+                    mnemonic = self.wallet_manager.decrypt_private_key(config.HD_MASTER_SEED)
+                    self._seed = seed_from_mnemonic(mnemonic, config.HD_PASSPHRASE)
+        return self._seed
+
+    def private_key(self, index: int) -> str:
+        """Приватный ключ (0x...) кошелька с индексом index"""
+        private_key = self._keys.get(index)
+        if private_key is None:
+            path = config.HD_DERIVATION_PATH.format(index=index)
+            private_key = '0x' + key_from_seed(self._get_seed(), path).hex()
+            self._keys.put(index, private_key)
+        return private_key
+
+    def address(self, index: int) -> str:
+        return Account.from_key(self.private_key(index)).address
+
+    def allocate_index(self) -> int:
+        """
+        Следующий свободный индекс. Счетчик берется из БД один раз, дальше
+        выдается локально; если индекс уже занял другой процесс (unique на
+        users.hd_index), WalletManager.create_user_wallet вызывает reset_index и повторяет
+        """
+        with self._lock:
+            if self._next_index is None:
+                self._next_index = UserService.get_max_hd_index() + 1
+            index = self._next_index
+            self._next_index += 1
+            return index
+
+    def reset_index(self):
+        """Перечитать счетчик из БД при следующем allocate_index"""
+        with self._lock:
+            self._next_index = None
+
+    def generate_wallet(self) -> dict:
+        """Кошелек для нового пользователя (формат как у WalletManager.generate_wallet)"""
+        index = self.allocate_index()
+        private_key = self.private_key(index)
+        address = Account.from_key(private_key).address
+        logger.info(f"Derived wallet #{index}: {address}")
+        return {
+            'address': address,
+            'private_key': private_key,
+            'encrypted_private_key': None,
+            'hd_index': index
+        }
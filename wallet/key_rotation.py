@@ -0,0 +1,121 @@
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from config.settings import config
+from database.models import User, WalletPoolEntry
+from database.db_service import KeyRotationService
+
+logger = logging.getLogger(__name__)
+
+ROTATED_MODELS = [User, WalletPoolEntry]
+
+ROTATION_ID_LABEL = b'raffle-key-rotation-id'
+
+# Состояние процесса-воркера
+_worker_wallet_manager = None
+
+
+def _init_worker():
+    global _worker_wallet_manager
+    from wallet.wallet_manager import WalletManager
+    _worker_wallet_manager = WalletManager()
+
+
+def _rotate(rows: list) -> list:
+    """Перешифровать [(id, ключ)] текущим ENCRYPTION_KEY (выполняется в процессе-воркере)"""
+    return [(row_id, _worker_wallet_manager.rotate_encrypted_key(encrypted_key)) for row_id, encrypted_key in rows]
+
+
+def rotation_fingerprint() -> str:
+    """
+    Идентификатор ротации - HMAC фиксированной метки на текущем ENCRYPTION_KEY
+    (в БД не попадает хеш самого ключа)
+    """
+    return hmac.new(config.ENCRYPTION_KEY.encode(), ROTATION_ID_LABEL, hashlib.sha256).hexdigest()[:16]
+
+
+class KeyRotator:
+    """
+    Перешифровка всех хранимых ключей текущим ENCRYPTION_KEY.
+
+    Таблицы users и wallet_pool читаются keyset-пагинацией по id частями
+    по chunk_size строк, часть перешифровывается в пуле из workers процессов
+    и записывается вместе с прогрессом (key_rotation_progress) одной
+    транзакцией. В памяти одновременно только одна часть; после остановки
+    повторный запуск продолжает с последнего записанного id. Пока идет
+    ротация, WalletManager расшифровывает и старыми ключами (ENCRYPTION_KEYS_OLD),
+    поэтому API и слушатели продолжают работать.
+    """
+    def __init__(self, chunk_size: int = None, workers: int = None, rotation_id: str = None,
+                 seed_output: str = None):
+        self.chunk_size = chunk_size or config.KEY_ROTATION_CHUNK_SIZE
+        self.workers = workers or config.KEY_ROTATION_WORKERS
+        self.rotation_id = rotation_id or rotation_fingerprint()
+        self.seed_output = seed_output
+
+    def run(self) -> int:
+        """
+        Returns:
+            Количество перешифрованных ключей за этот запуск
+        """
+        if not config.ENCRYPTION_KEYS_OLD:
+            logger.warning("ENCRYPTION_KEYS_OLD is empty: keys will be re-encrypted with the same key")
+
+        total = 0
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(config.SIGNING_START_METHOD),
+            initializer=_init_worker
+        ) as pool:
+            for model in ROTATED_MODELS:
+                total += self._rotate_table(pool, model)
+
+        if config.HD_MASTER_SEED:
+            self._export_master_seed()
+
+        logger.info(f"Key rotation {self.rotation_id} finished: {total} keys re-encrypted")
+        return total
+
+    def _export_master_seed(self):
+        """
+        Перешифрованный HD_MASTER_SEED хранится в окружении: отдаем его оператору
+        в stdout или в файл с правами 0600, но никогда не в лог
+        """
+        from wallet.wallet_manager import WalletManager
+        seed = WalletManager().rotate_encrypted_key(config.HD_MASTER_SEED)
+
+        if self.seed_output:
+            fd = os.open(self.seed_output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(seed + '\n')
+            logger.warning(f"HD_MASTER_SEED is stored in the environment, update it from {self.seed_output}")
+        else:
+            print(f"HD_MASTER_SEED={seed}")
+            logger.warning("HD_MASTER_SEED is stored in the environment, update it to the value printed to stdout")
+
+    def _rotate_table(self, pool: ProcessPoolExecutor, model) -> int:
+        table_name = model.__tablename__
+        last_id, rotated = KeyRotationService.get_progress(self.rotation_id, table_name)
+        if last_id:
+            logger.info(f"[{table_name}] Resuming key rotation after id {last_id} ({rotated} done)")
+
+        count = 0
+        while True:
+            rows = KeyRotationService.fetch_chunk(model, last_id, self.chunk_size)
+            if not rows:
+                break
+
+            part = -(-len(rows) // self.workers)
+            parts = [rows[i:i + part] for i in range(0, len(rows), part)]
+            rotated_rows = [row for result in pool.map(_rotate, parts) for row in result]
+
+            last_id = rows[-1][0]
+            KeyRotationService.save_chunk(model, self.rotation_id, rotated_rows, last_id)
+            count += len(rows)
+            logger.info(f"[{table_name}] Re-encrypted {rotated + count} keys (last id {last_id})")
+
+        return count
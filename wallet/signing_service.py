@@ -0,0 +1,84 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from eth_account import Account
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Состояние процесса-воркера
+_worker_wallet_manager = None
+
+
+def _init_worker():
+    global _worker_wallet_manager
+    from wallet.wallet_manager import WalletManager
+    _worker_wallet_manager = WalletManager()
+
+
+def _ping(_) -> int:
+    return os.getpid()
+
+
+def _sign(encrypted_key: str, hd_index: int, transaction: dict) -> bytes:
+    """Расшифровать (или вывести) ключ и подписать транзакцию (выполняется в процессе-воркере)"""
+    private_key = _worker_wallet_manager.get_private_key(encrypted_key, hd_index)
+    return bytes(Account.sign_transaction(transaction, private_key).rawTransaction)
+
+
+class SigningService:
+    """
+    Пул процессов для расшифровки ключей и подписи транзакций.
+
+    Fernet и secp256k1 выполняются в SIGNING_WORKERS процессах, поэтому не
+    держат GIL потоков API. В воркер передаются только зашифрованный ключ и
+    неподписанная транзакция (для HD-кошельков - индекс), обратно возвращаются байты подписанной
+    транзакции; расшифрованный ключ не покидает процесс-воркер.
+    """
+    def __init__(self, workers: int = None):
+        self.workers = workers if workers is not None else config.SIGNING_WORKERS
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self):
+        """
+        Создать пул и сразу поднять все процессы-воркеры
+        (до запуска фоновых потоков, чтобы fork не копировал их блокировки)
+        """
+        with self._lock:
+            if self._pool is not None or not self.enabled:
+                return
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(config.SIGNING_START_METHOD),
+                initializer=_init_worker
+            )
+            try:
+                pids = set(pool.map(_ping, range(self.workers), timeout=config.SIGNING_TIMEOUT))
+            except Exception:
+                # Непроверенный пул не сохраняем: следующий start() создаст новый
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            self._pool = pool
+        logger.info(f"Signing service started with {len(pids)} worker processes")
+
+    def sign(self, encrypted_key: str, transaction: dict, hd_index: int = None) -> bytes:
+        """Подписать транзакцию ключом пользователя, вернуть raw-байты для send_raw_transaction"""
+        self.start()
+        future = self._pool.submit(_sign, encrypted_key, hd_index, transaction)
+        return future.result(timeout=config.SIGNING_TIMEOUT)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+signing_service = SigningService()
@@ -1,11 +1,18 @@
 import logging
 from eth_keys import keys
+from eth_account import Account
 from web3 import Web3
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
+from sqlalchemy.exc import IntegrityError
 from config.settings import config
+from database.db_service import UserService, WalletPoolService
+from wallet.wallet_pool import wallet_pool
+from wallet.hd_wallet import HDWallet
 
 logger = logging.getLogger(__name__)
 
+HD_INDEX_ATTEMPTS = 5
+
 
 class WalletManager:
     def __init__(self):
@@ -13,26 +20,111 @@ class WalletManager:
         if isinstance(self.encryption_key, str):
             self.encryption_key = self.encryption_key.encode()
         
-        if len(self.encryption_key) != 32:
+        # Шифруем текущим ключом, расшифровываем текущим или любым из ENCRYPTION_KEYS_OLD
+        self.cipher = MultiFernet(
+            [self._fernet(self.encryption_key)] + [self._fernet(key) for key in config.ENCRYPTION_KEYS_OLD]
+        )
+        
+        self.hd_wallet = HDWallet(self) if config.WALLET_MODE == 'hd' else None
+    
+    @staticmethod
+    def _fernet(key) -> Fernet:
+        if isinstance(key, str):
+            key = key.encode()
+        
+        if len(key) != 32:
             raise ValueError("Encryption key must be exactly 32 characters long")
         
         import base64
-        encoded_key = base64.urlsafe_b64encode(self.encryption_key)
-        self.cipher = Fernet(encoded_key)
+        return Fernet(base64.urlsafe_b64encode(key))
+    
+    def rotate_encrypted_key(self, encrypted_key: str) -> str:
+        """Перешифровать ключ текущим ENCRYPTION_KEY (расшифровка - любым известным ключом)"""
+        if isinstance(encrypted_key, str):
+            encrypted_key = encrypted_key.encode()
+        return self.cipher.rotate(encrypted_key).decode()
     
     def generate_wallet(self) -> dict:
         """
-        Генерирует новый EVM кошелек
+        Выдает новый EVM кошелек: из пула заранее созданных (wallet_pool),
+        а если пул пуст или отключен - генерирует на месте.
+        При WALLET_MODE=hd кошелек выводится из мастер-сида.
         
         Returns:
             {
                 'address': '0x...',
                 'private_key': '0x...',
-                'encrypted_private_key': '...' (для хранения в БД)
+                'encrypted_private_key': '...' (для хранения в БД; None для HD),
+                'hd_index': int (только для HD),
+                'from_pool': True (только для кошелька из пула)
             }
         """
+        if self.hd_wallet is not None:
+            return self.hd_wallet.generate_wallet()
+        
+        if config.WALLET_POOL_ENABLED:
+            claimed = WalletPoolService.claim()
+            wallet_pool.notify_claimed()
+            if claimed:
+                address, encrypted_key = claimed
+                wallet = {
+                    'address': address,
+                    'encrypted_private_key': encrypted_key,
+                    'from_pool': True
+                }
+                try:
+                    wallet['private_key'] = self.decrypt_private_key(encrypted_key)
+                except Exception:
+                    self._return_to_pool(wallet)
+                    raise
+                logger.info(f"Issued wallet from pool: {address}")
+                return wallet
+            logger.warning("Wallet pool is empty, generating wallet inline")
+        
+        return self.create_wallet()
+    
+    def create_user_wallet(self, tg_id: str) -> dict:
+        """
+        Выдать кошелек и создать пользователя (формат как у generate_wallet).
+        При WALLET_MODE=hd индекс мог занять другой процесс API: тогда счетчик
+        перечитывается из БД и попытка повторяется с новым индексом
+        """
+        for _ in range(HD_INDEX_ATTEMPTS):
+            wallet = self.generate_wallet()
+            try:
+                UserService.create_user(
+                    tg_id=tg_id,
+                    evm_address=wallet['address'],
+                    encrypted_key=wallet['encrypted_private_key'],
+                    hd_index=wallet.get('hd_index')
+                )
+                return wallet
+            except IntegrityError:
+                self._return_to_pool(wallet)
+                if self.hd_wallet is None or UserService.get_user_by_tg_id(tg_id) is not None:
+                    raise
+                logger.warning(f"HD index {wallet['hd_index']} is already taken, reloading counter")
+                self.hd_wallet.reset_index()
+            except Exception:
+                self._return_to_pool(wallet)
+                raise
+        raise RuntimeError(f"Could not allocate an HD wallet index for {tg_id}")
+    
+    @staticmethod
+    def _return_to_pool(wallet: dict):
+        """Вернуть невыданный кошелек в пул: claim() уже удалил его строку, иначе ключ потерян"""
+        if not wallet.get('from_pool'):
+            return
         try:
-            account = Web3().eth.account.create()
+            WalletPoolService.add_wallets([(wallet['address'], wallet['encrypted_private_key'])])
+            logger.info(f"Returned wallet {wallet['address']} to pool")
+        except Exception as e:
+            logger.error(f"Could not return wallet {wallet['address']} to pool: {e}")
+    
+    def create_wallet(self) -> dict:
+        """Сгенерировать и зашифровать новый кошелек (формат как у generate_wallet)"""
+        try:
+            account = Account.create()
             
             private_key = account.key.hex()
             address = account.address
@@ -77,6 +169,14 @@ class WalletManager:
             logger.error(f"Error decrypting private key: {e}")
             raise
     
+    def get_private_key(self, encrypted_key: str = None, hd_index: int = None) -> str:
+        """Приватный ключ пользователя: выведенный по hd_index или расшифрованный"""
+        if hd_index is not None:
+            if self.hd_wallet is None:
+                raise ValueError("User has an HD wallet, but WALLET_MODE is not 'hd'")
+            return self.hd_wallet.private_key(hd_index)
+        return self.decrypt_private_key(encrypted_key)
+    
     def validate_address(self, address: str) -> bool:
         """Проверяет валидность адреса"""
         return Web3.is_address(address)
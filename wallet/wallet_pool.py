@@ -0,0 +1,81 @@
+import logging
+import threading
+from config.settings import config
+from database.db_service import WalletPoolService
+
+logger = logging.getLogger(__name__)
+
+
+class WalletPool:
+    """
+    Фоновое пополнение пула заранее созданных кошельков (таблица wallet_pool).
+
+    Ключи генерируются и шифруются в отдельном потоке, а не в запросе
+    /api/wallet/generate. Когда в пуле остается меньше
+    WALLET_POOL_LOW_WATERMARK кошельков, он пополняется пачками по
+    WALLET_POOL_REFILL_BATCH до WALLET_POOL_SIZE. Проверка выполняется раз в
+    WALLET_POOL_CHECK_SECONDS и сразу после выдачи кошелька из пула.
+    """
+    def __init__(self):
+        self.wallet_manager = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, wallet_manager):
+        """Запустить пополнение (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.wallet_manager = wallet_manager
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='wallet-pool', daemon=True)
+            self._thread.start()
+        logger.info("Wallet pool refiller started")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def notify_claimed(self):
+        """Кошелек выдан из пула - проверить уровень без ожидания таймера"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except Exception as e:
+                logger.error(f"Error refilling wallet pool: {e}")
+            self._wake.wait(config.WALLET_POOL_CHECK_SECONDS)
+            self._wake.clear()
+
+    def refill(self) -> int:
+        """
+        Пополнить пул до WALLET_POOL_SIZE, если он ниже WALLET_POOL_LOW_WATERMARK
+
+        Returns:
+            Количество добавленных кошельков
+        """
+        available = WalletPoolService.count()
+        if available >= config.WALLET_POOL_LOW_WATERMARK:
+            return 0
+
+        added = 0
+        while available + added < config.WALLET_POOL_SIZE and not self._stop.is_set():
+            size = min(config.WALLET_POOL_REFILL_BATCH, config.WALLET_POOL_SIZE - available - added)
+            wallets = []
+            for _ in range(size):
+                wallet = self.wallet_manager.create_wallet()
+                wallets.append((wallet['address'], wallet['encrypted_private_key']))
+            WalletPoolService.add_wallets(wallets)
+            added += size
+
+        logger.info(f"Wallet pool refilled: +{added}, {available + added} available")
+        return added
+
+
+wallet_pool = WalletPool()